@@ -1,8 +1,12 @@
+import argparse
 import aiohttp
 import asyncio
+import hashlib
 import certifi
+import json
 import ssl
 import sys
+import os
 import re
 
 import meta
@@ -11,6 +15,9 @@ from string import Template
 
 ssl_context = ssl.create_default_context(cafile=certifi.where())
 
+CACHE_PATH = '.build-cache/metadata.json' # snapshot of all fetched metadata - reused if unchanged, and needed for offline builds
+MAX_CONCURRENT_REQUESTS = 8
+
 with open('template/init.py', 'r') as f:
     INIT_TEMPLATE = Template(f.read())
 with open('template/service-class.py', 'r') as f:
@@ -136,81 +143,156 @@ def parse_arg(arg_meta, types_meta, override_name: str = None):
 
     return arg_meta, t, '\n\n'.join(desc), t_parser
 
-# returns either a string containing a class definition for the given service, or None if it should be omitted
-async def generate_service(session, base_url: str, services_url: str, service_name: str, types_meta):
-    async with session.get(f'{services_url}/{service_name}', ssl = ssl_context) as res:
-        meta = await res.json(content_type=None) # ignore content type in case response mime type is wrong
-        if 'servicePath' not in meta or not meta['servicePath']:
-            return None # only generate code for fs services
-
-        rpcs = []
-        for rpc_name, rpc_meta in meta['rpcs'].items():
-            is_deprecated = rpc_meta.get('deprecated', False)
-
-            required, non_required = [], []
-            for arg_meta in rpc_meta['args']:
-                (non_required if 'optional' in arg_meta and arg_meta['optional'] else required).append(parse_arg(arg_meta, types_meta))
-
-            ret_info = parse_arg(rpc_meta.get('returns'), types_meta, 'returns')
-            args = ['self'] + [f'{clean_fn_name(x[0]["name"])}: {x[1]}' for x in required] + [f'{clean_fn_name(x[0]["name"])}: {x[1]} = None' for x in non_required]
-            payloads = [f"'{x[0]['name']}': {clean_fn_name(x[0]['name'])}" for x in required + non_required]
-
-            desc = ([rpc_meta['description']] if rpc_meta.get('description') else []) + [x[2] for x in required + non_required] + ([ret_info[2]] if 'returns' in rpc_meta else [])
-            desc = '\n\n'.join(desc)
-            desc = indent(f"'''\n{desc}\n'''", 8)
-
-            code = f"self._client.call('{service_name}', '{rpc_name}', **{{ {', '.join(payloads)} }})"
-            code = f'res = {code}\nreturn {ret_info[3]}(res)' if ret_info[3] else f'return {code}'
-
-            fn_name = clean_fn_name(rpc_name)
-            meta_name = f'_{fn_name}' if is_deprecated else fn_name
-            prefix = '    @deprecated()\n' if is_deprecated else ''
-
-            ret_str = f' -> {ret_info[1]}' if 'returns' in rpc_meta else ''
-            rpcs.append((fn_name, f"{prefix}    def {meta_name}({', '.join(args)}){ret_str}:\n{desc}\n{indent(code, 8)}"))
-
-        rpcs = [x[1] for x in sorted(rpcs)] # sort rpcs so they'll be in alphabetical order by name
-        service_desc = f"'''\n{meta['description']}\n'''" if 'description' in meta and meta['description'] else ''
-        formatted = SERVICE_CLASS_TEMPLATE.substitute({ 'service_name': clean_class_name(service_name), 'service_desc': indent(service_desc, 4), 'rpcs': '\n'.join(rpcs) })
-        return (service_name, formatted, service_desc)
-
-async def generate_client(base_url, client_name):
-    async with aiohttp.ClientSession() as session:
-        async with session.get(f'{base_url}/configuration', ssl = ssl_context) as res:
-            services_url = (await res.json(content_type=None))['servicesHosts'][0]['url'] # ignore content type in case response type is wrong
-        async with session.get(services_url, ssl = ssl_context) as res:
-            services_meta = await res.json(content_type=None) # ignore content type in case response mime type is wrong
-        async with session.get(f'{services_url}/input-types', ssl = ssl_context) as tres:
-            types_meta = await tres.json(content_type=None) # ignore content type in case response mime type is wrong
-            services = await asyncio.gather(*[asyncio.ensure_future(generate_service(session, base_url, services_url, x['name'], types_meta)) for x in services_meta])
-            services = sorted([x for x in services if x]) # remove None values (omitted services) and sort to make sure they're in a consistent order
-
-            service_classes = '\n'.join([x[1] for x in services])
-            service_instances = '\n'.join([f'        self.{clean_fn_name(x[0])} = {clean_class_name(x[0])}(self)\n{indent(x[2], 8)}\n' for x in services])
-
-            return CLIENT_CLASS_TEMPLATE.substitute({ 'client_name': client_name, 'base_url': base_url,
-                'service_classes': service_classes, 'service_instances': service_instances })
-
-async def generate_client_save(base_url, client_name, save_path):
-    content = await generate_client(base_url, client_name)
-    with open(save_path, 'w', encoding = 'utf-8') as f: # explicit encoding needed on windows
+class MetadataCache:
+    '''
+    Fetches json metadata from the server, keeping an on-disk snapshot of everything fetched.
+    Entries are revalidated with their ETag (if the server gave one), and a content hash tells us whether anything actually changed.
+    In offline mode, everything comes from the snapshot, which makes builds reproducible.
+    '''
+    def __init__(self, session, path: str, *, offline: bool):
+        self.session = session
+        self.path = path
+        self.offline = offline
+        self.semaphore = asyncio.Semaphore(MAX_CONCURRENT_REQUESTS) # don't flood the server with requests
+        self.stats = { 'unchanged': 0, 'changed': 0 }
+
+        self.entries = {}
+        if os.path.isfile(path):
+            with open(path, 'r', encoding = 'utf-8') as f:
+                self.entries = json.load(f)
+        self.used = set()
+
+    async def get_json(self, url: str):
+        self.used.add(url)
+        entry = self.entries.get(url)
+        if self.offline:
+            if entry is None:
+                raise RuntimeError(f'No cached metadata for {url} - run an online build first to create the snapshot')
+            self.stats['unchanged'] += 1
+            return entry['data']
+
+        headers = { 'If-None-Match': entry['etag'] } if entry is not None and entry.get('etag') else {}
+        async with self.semaphore:
+            async with self.session.get(url, ssl = ssl_context, headers = headers) as res:
+                if res.status == 304 and entry is not None:
+                    self.stats['unchanged'] += 1
+                    return entry['data']
+                data = await res.json(content_type=None) # ignore content type in case response mime type is wrong
+                etag = res.headers.get('ETag')
+
+        digest = hashlib.sha256(json.dumps(data, sort_keys = True).encode('utf-8')).hexdigest()
+        self.stats['unchanged' if entry is not None and entry['hash'] == digest else 'changed'] += 1
+        self.entries[url] = { 'etag': etag, 'hash': digest, 'data': data }
+        return data
+
+    def save(self) -> None:
+        if self.offline: return
+        entries = { k: v for k, v in self.entries.items() if k in self.used } # drop metadata for things that no longer exist
+        os.makedirs(os.path.dirname(self.path), exist_ok = True)
+        write_if_changed(self.path, json.dumps(entries, indent = 1, sort_keys = True))
+
+# returns true if the file was (re)written
+def write_if_changed(path: str, content: str) -> bool:
+    if os.path.isfile(path):
+        with open(path, 'r', encoding = 'utf-8') as f:
+            if f.read() == content: return False
+    with open(path, 'w', encoding = 'utf-8') as f: # explicit encoding needed on windows
         f.write(content)
-async def main():
+    return True
+
+# returns either a string containing a class definition for the given service, or None if it should be omitted
+async def generate_service(cache: MetadataCache, base_url: str, services_url: str, service_name: str, types_meta):
+    meta = await cache.get_json(f'{services_url}/{service_name}')
+    if 'servicePath' not in meta or not meta['servicePath']:
+        return None # only generate code for fs services
+
+    rpcs = []
+    for rpc_name, rpc_meta in meta['rpcs'].items():
+        is_deprecated = rpc_meta.get('deprecated', False)
+
+        required, non_required = [], []
+        for arg_meta in rpc_meta['args']:
+            (non_required if 'optional' in arg_meta and arg_meta['optional'] else required).append(parse_arg(arg_meta, types_meta))
+
+        ret_info = parse_arg(rpc_meta.get('returns'), types_meta, 'returns')
+        args = ['self'] + [f'{clean_fn_name(x[0]["name"])}: {x[1]}' for x in required] + [f'{clean_fn_name(x[0]["name"])}: {x[1]} = None' for x in non_required]
+        payloads = [f"'{x[0]['name']}': {clean_fn_name(x[0]['name'])}" for x in required + non_required]
+
+        desc = ([rpc_meta['description']] if rpc_meta.get('description') else []) + [x[2] for x in required + non_required] + ([ret_info[2]] if 'returns' in rpc_meta else [])
+        desc = '\n\n'.join(desc)
+        desc = indent(f"'''\n{desc}\n'''", 8)
+
+        code = f"self._client.call('{service_name}', '{rpc_name}', **{{ {', '.join(payloads)} }})"
+        code = f'res = {code}\nreturn {ret_info[3]}(res)' if ret_info[3] else f'return {code}'
+
+        fn_name = clean_fn_name(rpc_name)
+        meta_name = f'_{fn_name}' if is_deprecated else fn_name
+        prefix = '    @deprecated()\n' if is_deprecated else ''
+
+        ret_str = f' -> {ret_info[1]}' if 'returns' in rpc_meta else ''
+        rpcs.append((fn_name, f"{prefix}    def {meta_name}({', '.join(args)}){ret_str}:\n{desc}\n{indent(code, 8)}"))
+
+    rpcs = [x[1] for x in sorted(rpcs)] # sort rpcs so they'll be in alphabetical order by name
+    service_desc = f"'''\n{meta['description']}\n'''" if 'description' in meta and meta['description'] else ''
+    formatted = SERVICE_CLASS_TEMPLATE.substitute({ 'service_name': clean_class_name(service_name), 'service_desc': indent(service_desc, 4), 'rpcs': '\n'.join(rpcs) })
+    return (service_name, formatted, service_desc)
+
+async def generate_client(cache: MetadataCache, base_url, client_name):
+    services_url = (await cache.get_json(f'{base_url}/configuration'))['servicesHosts'][0]['url']
+    services_meta, types_meta = await asyncio.gather(cache.get_json(services_url), cache.get_json(f'{services_url}/input-types'))
+    services = await asyncio.gather(*[asyncio.ensure_future(generate_service(cache, base_url, services_url, x['name'], types_meta)) for x in services_meta])
+    services = sorted([x for x in services if x]) # remove None values (omitted services) and sort to make sure they're in a consistent order
+
+    # each service class goes in its own module so that it is only imported (and instantiated) when first used
+    service_instances = []
+    for name, _, desc in services:
+        fn_name, class_name = clean_fn_name(name), clean_class_name(name)
+        desc = f'{indent(desc, 8)}\n' if desc else ''
+        service_instances.append(f"    @_functools.cached_property\n    def {fn_name}(self) -> '{class_name}':\n{desc}        from .{fn_name} import {class_name}\n        return {class_name}(self)\n")
+    service_imports = '\n'.join([f'    from .{clean_fn_name(x[0])} import {clean_class_name(x[0])}' for x in services])
+    service_imports = f'if TYPE_CHECKING: # lets editors and type checkers see the service classes, which are otherwise imported on demand\n{service_imports}' if services else ''
+    service_modules = '\n'.join([f"    '{clean_class_name(x[0])}': '{clean_fn_name(x[0])}'," for x in services])
+
+    client = CLIENT_CLASS_TEMPLATE.substitute({ 'client_name': client_name, 'base_url': base_url,
+        'service_instances': '\n'.join(service_instances), 'service_imports': service_imports, 'service_modules': service_modules })
+    return client, { clean_fn_name(x[0]): x[1] for x in services }
+
+# returns the number of files that were (re)written
+async def generate_client_save(cache: MetadataCache, base_url, client_name, save_path) -> int:
+    client, service_modules = await generate_client(cache, base_url, client_name)
+
+    if os.path.isfile(f'{save_path}.py'):
+        os.remove(f'{save_path}.py') # older versions generated a single module, which would be confusing to leave around
+    os.makedirs(save_path, exist_ok = True)
+    for file in os.listdir(save_path): # remove modules for services that no longer exist
+        if file.endswith('.py') and file != '__init__.py' and file[:-3] not in service_modules:
+            os.remove(os.path.join(save_path, file))
+
+    files = [('__init__.py', client), *[(f'{k}.py', v) for k, v in service_modules.items()]]
+    return sum(write_if_changed(os.path.join(save_path, path), content) for path, content in files) # only touch changed files
+async def main(*, offline: bool = False, cache_path: str = CACHE_PATH):
     init_content = INIT_TEMPLATE.substitute({ 'description': meta.description, 'version': meta.version, 'author': meta.author, 'credits': meta.credits })
-    with open('netsblox/__init__.py', 'w', encoding = 'utf-8') as f: # explicit encoding needed on windows
-        f.write(init_content)
+    write_if_changed('netsblox/__init__.py', init_content)
 
     args = [
-        ('https://cloud.netsblox.org', 'Client', 'netsblox/editor.py'),
-        # ('https://cloud.dev.netsblox.org', 'Client', 'netsblox/dev.py'),
+        ('https://cloud.netsblox.org', 'Client', 'netsblox/editor'),
+        # ('https://cloud.dev.netsblox.org', 'Client', 'netsblox/dev'),
     ]
-    await asyncio.gather(*[asyncio.ensure_future(generate_client_save(*x)) for x in args])
+    async with aiohttp.ClientSession() as session:
+        cache = MetadataCache(session, cache_path, offline = offline)
+        written = await asyncio.gather(*[asyncio.ensure_future(generate_client_save(cache, *x)) for x in args])
+        cache.save()
+    print(f'metadata: {cache.stats["changed"]} changed, {cache.stats["unchanged"]} unchanged{" (offline)" if offline else ""} - rewrote {sum(written)} files')
 
-def main_sync():
+def main_sync(**kwargs):
     loop = asyncio.new_event_loop()
-    loop.run_until_complete(main())
+    loop.run_until_complete(main(**kwargs))
     loop.run_until_complete(asyncio.sleep(1)) # workaround needed on windows - for some reason they close the proactor event loop early otherwise
     loop.close()
 
 if __name__ == '__main__':
-    main_sync()
+    parser = argparse.ArgumentParser(description = 'generates the netsblox client modules from the services on the server')
+    parser.add_argument('--offline', action = 'store_true', help = 'build entirely from the cached metadata snapshot (for reproducible builds)')
+    parser.add_argument('--cache', default = CACHE_PATH, help = f'path of the metadata snapshot (default {CACHE_PATH})')
+    args = parser.parse_args()
+    main_sync(offline = args.offline, cache_path = args.cache)
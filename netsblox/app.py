@@ -477,6 +477,15 @@ def play_button():
 _package_dir = netsblox.__path__[0]
 def module_path(path: str) -> str:
     return f'{_package_dir}/{path}'
+def user_cache_path(path: str) -> str:
+    # the package directory may be read-only or shared between users, so caches go in the per-user cache directory instead
+    if sys.platform == 'win32':
+        base = os.environ.get('LOCALAPPDATA') or os.path.expanduser('~/AppData/Local')
+    elif sys.platform == 'darwin':
+        base = os.path.expanduser('~/Library/Caches')
+    else:
+        base = os.environ.get('XDG_CACHE_HOME') or os.path.expanduser('~/.cache')
+    return os.path.join(base, 'pyblox', path)
 
 _cached_install_id = None
 _cached_install_id_mutex = threading.Lock()
@@ -921,7 +930,7 @@ class Imports:
 
         lines.append('class images:')
         for name, entry in self.images.items():
-            lines.append(f'    {name} = set_center(netsblox.common.decode_image(\'{"<<<OMITTED>>>" if omit_media else common.encode_image(entry["img"])}\').convert(\'RGBA\'), {tuple(entry["center"])})')
+            lines.append(f'    {name} = set_center(netsblox.common.decode_image(\'{"<<<OMITTED>>>" if omit_media else common.encode_image(entry["img"], compress_level = 1, cache = True)}\').convert(\'RGBA\'), {tuple(entry["center"])})') # the script is temporary, so favor speed over size
         if len(self.images) == 0:
             lines.append('    pass')
         lines.append('images = images()')
@@ -1168,7 +1177,7 @@ class ProjectEditor(tk.Frame):
                     'value': common.lossless_split(editor.text.get('1.0', 'end-1c'), '\n'),
                 })
 
-            role_res['images'] = { name: { 'img': common.encode_image(entry['img']), 'center': entry['center'][:] } for name, entry in self.imports.images.items() }
+            role_res['images'] = { name: { 'img': common.encode_image(entry['img'], cache = True), 'center': entry['center'][:] } for name, entry in self.imports.images.items() }
             role_res['sounds'] = { name: { 'snd': common.encode_sound(entry['snd']) } for name, entry in self.imports.sounds.items() }
 
         return res
@@ -1234,6 +1243,7 @@ class ProjectEditor(tk.Frame):
             else:
                 raise RuntimeError(f'unknown blocks type: {type(blocks)}')
 
+        common.prefetch(texts = new_sources) # download all the block sources at once rather than one at a time below
         for src in new_sources:
             add_blocks(json.loads(common.load_text(src)), source = src)
         add_blocks(proj.get('blocks', []), source = None)
@@ -1242,6 +1252,7 @@ class ProjectEditor(tk.Frame):
             'stage': proj.get('stage_blocks', []),
             'sprite': proj.get('turtle_blocks', []),
         }, source = None)
+        common.prefetch(images = [block['url'] for block in new_blocks], wait = False) # the block palette needs these soon, but not right now
 
         self.client_type = client_type
         self.logs = logs
@@ -2058,7 +2069,7 @@ from netsblox import get_location, get_error, nothrow, Namespace
 from netsblox.graphical import *
 from netsblox.concurrency import *
 globals = Namespace(globals())
-nb = $client_type(project_name = """$project_name""", project_id = $project_id)
+nb = $client_type(project_name = """$project_name""", project_id = $project_id, background_connect = True)
 'A connection to NetsBlox, which allows you to use services and RPCs from python.'
 netsblox.graphical._INITIAL_SIZE = $stage_size
 getattr(netsblox.graphical._get_proj_handle(), '_Project__tk').title(f'PyBlox - {nb.public_id}')
@@ -2875,9 +2886,11 @@ def main():
     parser = argparse.ArgumentParser()
     parser.add_argument('project', type = str, nargs = '?', default = None)
     parser.add_argument('--log-to', type = str, default = 'https://logging.pyblox.netsblox.org')
+    parser.add_argument('--download-cache', type = str, default = user_cache_path('downloads'), help = 'directory for keeping downloaded block images and sources between runs (empty to disable)')
     args = parser.parse_args()
 
     _logger_instance = Logger(target = args.log_to)
+    common.set_download_cache(args.download_cache or None)
 
     root = tk.Tk()
     root.geometry('1200x600')
@@ -1,12 +1,18 @@
 import netsblox as _netsblox
-from netsblox import sound as _Sound
 
 import randomname as _randomname
 import threading as _threading
+import collections as _collections
+import hashlib as _hashlib
+import concurrent.futures as _futures
 import requests as _requests
 import difflib as _difflib
 import inspect as _inspect
+import copy as _copy
+import time as _time
 import base64 as _base64
+import math as _math
+import zlib as _zlib
 import numpy as _np
 import json as _json
 import sys as _sys
@@ -14,7 +20,16 @@ import io as _io
 import os as _os
 from PIL import Image as _Image, ImageTk as _ImageTk
 
-from typing import Tuple, List, Any, Optional, Dict
+try:
+    # orjson is much faster than the builtin json module (and serializes numpy arrays directly), but we don't require it
+    import orjson as _orjson
+except:
+    _orjson = None
+
+from typing import Tuple, List, Any, Optional, Dict, Literal, Callable, Iterable, TYPE_CHECKING
+
+if TYPE_CHECKING: # sound pulls in pygame, which is slow to import, so we only load it when needed
+    from netsblox import sound as _Sound
 
 _NETSBLOX_PY_PATH = _os.path.dirname(_netsblox.__file__)
 
@@ -78,80 +93,266 @@ def scale_image(img: _Image.Image, scale: float = 1) -> _Image.Image:
     new_size = tuple(round(v * scale) for v in img.size)
     return img.resize(new_size, resample = get_antialias_mode())
 
-_img_lock = _threading.Lock()
-_img_cache = {}
+class _AssetCache:
+    # a thread-safe LRU cache which evicts the least recently used values once their total size exceeds max_size.
+    # each key is loaded at most once at a time (threads wanting a key which is being loaded wait for that load),
+    # but the lock is never held during a load, so loads of different keys (e.g., downloads) happen concurrently
+    def __init__(self, max_size: int, size_of: Callable[[Any], int]):
+        self.__max_size = max_size
+        self.__size_of = size_of
+        self.__lock = _threading.Lock()
+        self.__values = _collections.OrderedDict() # key -> (value, size), least recently used first
+        self.__size = 0
+        self.__loading: Dict[str, _threading.Event] = {}
+        self.__stats = { 'hits': 0, 'misses': 0, 'evictions': 0 }
+
+    @property
+    def stats(self) -> Dict[str, int]:
+        with self.__lock:
+            return { **self.__stats, 'entries': len(self.__values), 'size': self.__size }
+
+    def get(self, key: str, load: Callable[[], Any]) -> Any:
+        while True:
+            with self.__lock:
+                entry = self.__values.get(key)
+                if entry is not None:
+                    self.__values.move_to_end(key)
+                    self.__stats['hits'] += 1
+                    return entry[0]
+                done = self.__loading.get(key)
+                if done is None:
+                    done = self.__loading[key] = _threading.Event()
+                    self.__stats['misses'] += 1
+                    break
+            done.wait() # if that load failed, we try it ourselves
+
+        try:
+            value = load()
+            size = self.__size_of(value)
+            with self.__lock:
+                if size <= self.__max_size: # otherwise it would just evict everything else (including itself)
+                    self.__values[key] = (value, size)
+                    self.__size += size
+                    while self.__size > self.__max_size:
+                        self.__size -= self.__values.popitem(last = False)[1][1]
+                        self.__stats['evictions'] += 1
+            return value
+        finally:
+            with self.__lock:
+                del self.__loading[key]
+            done.set()
+
+    def clear(self) -> None:
+        with self.__lock:
+            self.__values.clear()
+            self.__size = 0
+
+_download_cache_dir: Optional[str] = None
+_download_cache_max_age: float = 0
+def set_download_cache(path: Optional[str], *, max_age: float = 24 * 60 * 60) -> None:
+    '''
+    Sets a directory where files downloaded by `load_image` and `load_text` are kept,
+    so that later runs (e.g., opening the editor again) don't download them again.
+    The default is `None`, which doesn't keep downloads.
+
+    Kept downloads are used as-is for `max_age` seconds (default one day).
+    After that, the server is asked whether they changed (which is cheap if they didn't),
+    and if the server can't be reached, the old download is used anyway.
+    '''
+    global _download_cache_dir, _download_cache_max_age
+    _download_cache_dir = path
+    _download_cache_max_age = max_age
+
+def _download(uri: str) -> Tuple[int, bytes]:
+    # the status code and content of a GET request, using the download cache if there is one
+    path = _os.path.join(_download_cache_dir, _hashlib.sha256(uri.encode('utf-8')).hexdigest()) if _download_cache_dir else None
+    cached, headers = None, {}
+    if path is not None and _os.path.exists(path):
+        try:
+            with open(path, 'rb') as f:
+                cached = f.read()
+            if _time.time() - _os.path.getmtime(path) < _download_cache_max_age:
+                return 200, cached
+            with open(f'{path}.meta', 'r') as f: # the validators from when we downloaded it, so the server can tell us if it changed
+                meta = parse_json(f.read())
+            headers = { k: meta[v] for k, v in [('If-None-Match', 'etag'), ('If-Modified-Since', 'last-modified')] if meta.get(v) }
+        except (OSError, ValueError):
+            pass
+
+    try:
+        res = _requests.get(uri, headers = headers)
+    except Exception:
+        if cached is None: raise
+        return 200, cached # probably offline, and an old copy is better than nothing
+
+    if res.status_code == 304 and cached is not None:
+        try:
+            _os.utime(path) # fresh for another max_age
+        except OSError:
+            pass
+        return 200, cached
+    if res.status_code == 200 and path is not None:
+        try:
+            _os.makedirs(_download_cache_dir, exist_ok = True)
+            # content first, so that a crash in between leaves old validators (which just cause a full download next time)
+            for dst, data in [(path, res.content), (f'{path}.meta', small_json({ 'etag': res.headers.get('ETag'), 'last-modified': res.headers.get('Last-Modified') }).encode('utf-8'))]:
+                tmp = f'{dst}.{_threading.get_ident()}.tmp'
+                with open(tmp, 'wb') as f:
+                    f.write(data)
+                _os.replace(tmp, dst) # atomic, so concurrent runs never see a partial file
+        except OSError:
+            pass # the cache is just an optimization
+    return res.status_code, res.content
+
+_img_cache = _AssetCache(128 * 1024 * 1024, lambda img: img.width * img.height * len(img.getbands()))
 _error_image = _Image.new('RGB', (50, 50), (252, 3, 244))
 def load_image(uri: str) -> _Image.Image:
-    img = _error_image
     protocol = uri[:uri.find('://')]
-    with _img_lock:
-        if uri in _img_cache:
-            return _img_cache[uri]
-        elif protocol == 'netsblox':
-            img = _Image.open(f'{_NETSBLOX_PY_PATH}/{uri[11:]}')
-        elif protocol == 'base64':
-            return decode_image(uri[9:]) # return so we don't cache local data (also the uri is long)
+    if protocol == 'base64':
+        return decode_image(uri[9:]) # don't cache local data (also the uri is long)
+
+    def load():
+        if protocol == 'netsblox':
+            return _Image.open(f'{_NETSBLOX_PY_PATH}/{uri[11:]}')
         elif protocol in ['https', 'http']:
-            res = _requests.get(uri)
-            if res.status_code == 200:
-                img = _Image.open(_io.BytesIO(res.content))
-            else:
-                print(f'Failed to load image {uri} (error code {res.status_code})\n\nMake sure the web host allows direct downloads.', file = _sys.stderr)
+            status, content = _download(uri)
+            if status == 200:
+                return _Image.open(_io.BytesIO(content))
+            print(f'Failed to load image {uri} (error code {status})\n\nMake sure the web host allows direct downloads.', file = _sys.stderr)
         else:
             print(f'Failed to load image {uri} (unknown protocol)', file = _sys.stderr)
-
-        _img_cache[uri] = img
-        return img
+        return _error_image
+    return _img_cache.get(uri, load)
 def load_tkimage(uri: str, *, scale: float = 1) -> _ImageTk.PhotoImage:
     return _ImageTk.PhotoImage(scale_image(load_image(uri), scale))
 
-_text_lock = _threading.Lock()
-_text_cache = {}
+_text_cache = _AssetCache(32 * 1024 * 1024, len)
 def load_text(uri: str) -> str:
-    txt = None
     protocol = uri[:uri.find('://')]
-    with _text_lock:
-        if uri in _text_cache:
-            return _text_cache[uri]
-        elif protocol == 'netsblox':
+    def load():
+        if protocol == 'netsblox':
             with open(f'{_NETSBLOX_PY_PATH}/{uri[11:]}', 'r') as f:
-                txt = f.read()
+                return f.read()
         elif protocol in ['https', 'http']:
-            res = _requests.get(uri)
-            if res.status_code == 200:
-                txt = res.content
-            else:
-                raise RuntimeError(f'Failed to download file at {uri} (error code {res.status_code})\n\nMake sure the web host allows direct downloads.')
+            status, content = _download(uri)
+            if status == 200:
+                return content
+            raise RuntimeError(f'Failed to download file at {uri} (error code {status})\n\nMake sure the web host allows direct downloads.')
         else:
             raise RuntimeError(f'Failed to download file at {uri} (unknown protocol)')
+    return _text_cache.get(uri, load)
+
+def prefetch(*, texts: Iterable[str] = (), images: Iterable[str] = (), on_progress: Optional[Callable[[int, int], None]] = None, wait: bool = True, max_workers: int = 8) -> None:
+    '''
+    Loads the given `load_text` and `load_image` uris concurrently, so that later calls to those functions can use the cached results.
+    `on_progress(done, total)` is called (from a background thread) after each uri is loaded.
+    If `wait` is false, this returns immediately and the loads continue in the background.
+
+    Errors are ignored here, since the failed uri will just be loaded again (and fail normally) when it is actually needed.
+    '''
+    jobs = [(load_text, x) for x in dict.fromkeys(texts)] + [(load_image, x) for x in dict.fromkeys(images)]
+    if len(jobs) == 0: return
 
-        assert txt is not None
-        _text_cache[uri] = txt
-        return txt
+    done = [0]
+    done_lock = _threading.Lock()
+    def run(job):
+        try:
+            job[0](job[1])
+        except Exception:
+            pass
+        with done_lock:
+            done[0] += 1
+            count = done[0]
+        if on_progress is not None: on_progress(count, len(jobs))
+
+    pool = _futures.ThreadPoolExecutor(max_workers = min(max_workers, len(jobs)), thread_name_prefix = 'prefetch')
+    for job in jobs:
+        pool.submit(run, job)
+    pool.shutdown(wait = wait)
 
 def generate_project_id() -> str:
     return f'_py-{_randomname.get_name()}'
 
-def small_json(obj):
-    def prep_value(obj):
-        if type(obj) in [list, tuple]:
-            return [prep_value(x) for x in obj]
-        if type(obj) is dict:
-            return { prep_value(k): prep_value(v) for k,v in obj.items() }
-        if type(obj) is _np.ndarray:
-            return obj.tolist()
-        return obj
-    return _json.dumps(prep_value(obj), separators=(',', ':'))
-
-def prep_send(val):
+def _json_default(obj):
+    # only called for values the json encoder doesn't natively support, so containers are still handled in a single (native) pass
+    if isinstance(obj, _np.ndarray):
+        return obj.tolist()
+    if isinstance(obj, _np.generic):
+        return obj.item()
+    if isinstance(obj, _Image.Image):
+        return f'<costume image="data:image/png;base64,{encode_image(obj)}"/>'
+    if isinstance(obj, (set, frozenset)):
+        return list(obj)
+    if isinstance(obj, float): # float subclasses that orjson refuses to serialize directly
+        return float(obj)
+    if isinstance(obj, list): # list subclasses (e.g., compact snap lists) might not keep their items in the list itself
+        return _np.asarray(obj) if hasattr(obj, '__array__') else list(obj)
+    if isinstance(obj, dict):
+        return dict(obj)
+    if isinstance(obj, str):
+        return str(obj)
+    if isinstance(obj, int):
+        return int(obj)
+    raise TypeError(f'Object of type {type(obj).__name__} is not JSON serializable')
+
+def _json_default_raw_images(obj):
+    if isinstance(obj, _Image.Image):
+        return encode_image_raw(obj)
+    return _json_default(obj)
+
+def _json_finite(obj):
+    # json has no NaN or infinity, so they are written as null (like orjson and javascript do)
+    if isinstance(obj, float): return obj if _math.isfinite(obj) else None
+    if isinstance(obj, dict): return { k: _json_finite(v) for k, v in obj.items() }
+    if isinstance(obj, (list, tuple)): return [_json_finite(x) for x in obj]
+    return obj
+
+ImageEncoding = Literal['costume', 'raw']
+_JSON_DEFAULTS = { 'costume': _json_default, 'raw': _json_default_raw_images }
+
+def small_json(obj, *, images: ImageEncoding = 'costume') -> str:
+    '''
+    Encodes `obj` as compact json.
+    Images are encoded as Snap costumes by default, or as raw pixel attachments (see `encode_image_raw()`) if `images = 'raw'`.
+    '''
+    default = _JSON_DEFAULTS.get(images)
+    if default is None: raise RuntimeError(f'Unknown image encoding: \'{images}\'')
+    if _orjson is not None:
+        try:
+            return _orjson.dumps(obj, default = default, option = _orjson.OPT_SERIALIZE_NUMPY | _orjson.OPT_NON_STR_KEYS | _orjson.OPT_PASSTHROUGH_SUBCLASS).decode('utf-8')
+        except TypeError:
+            pass # fall back to the builtin encoder for anything orjson can't handle (e.g., huge ints)
+    try:
+        return _json.dumps(obj, separators = (',', ':'), default = default, allow_nan = False)
+    except ValueError: # NaN or infinity somewhere, which is rare enough that we only look for them after the fact
+        return _json.dumps(_json_finite(obj), separators = (',', ':'), default = lambda x: _json_finite(default(x)), allow_nan = False)
+
+def parse_json(src: Any) -> Any:
+    if _orjson is not None:
+        try:
+            return _orjson.loads(src)
+        except ValueError:
+            pass # builtin json is more lenient (e.g., NaN and Infinity)
+    return _json.loads(src)
+
+_SEND_SCALARS = { int, float, str, bool }
+def prep_send(val, *, detach: bool = False, keep_images: bool = False):
+    # containers are always rebuilt, so `detach` only needs to copy the (mutable) leaf values, e.g., numpy arrays
+    # `keep_images` leaves images as they are, so they can be encoded later depending on the receiver (see `small_json()`)
+    t = type(val)
+    if t in _SEND_SCALARS:
+        return val
     if val is None:
         return '' # NetsBlox expects empty string for no value
-    if any(isinstance(val, t) for t in [list, tuple, set]):
-        return [prep_send(v) for v in val]
+    if isinstance(val, (list, tuple, set)):
+        return [prep_send(v, detach = detach, keep_images = keep_images) for v in val]
     elif isinstance(val, dict):
-        return [[prep_send(k), prep_send(v)] for k,v in val.items()]
+        return [[prep_send(k, detach = detach, keep_images = keep_images), prep_send(v, detach = detach, keep_images = keep_images)] for k,v in val.items()]
     elif isinstance(val, _Image.Image):
+        if keep_images: return val.copy() if detach else val
         return f'<costume image="data:image/png;base64,{encode_image(val)}"/>'
+    elif detach:
+        return _copy.deepcopy(val)
     else:
         return val
 
@@ -185,17 +386,70 @@ def get_location() -> Tuple[float, float]:
     except:
         return (0.0, 0.0) # instead of hard failing, just give an obvious invalid value
 
-def encode_image(img: _Image.Image) -> str:
-    res = _io.BytesIO()
-    img.save(res, 'png')
-    return _base64.b64encode(res.getvalue()).decode('ascii')
+def _image_digest(img: _Image.Image) -> str:
+    # a hash of everything that affects the encoded png, so that modified images are never confused with the original
+    h = _hashlib.blake2b(f'{img.mode}:{img.size}:{sorted(img.info.items())!r}'.encode('utf-8'), digest_size = 20)
+    if img.palette is not None: h.update(img.palette.tobytes())
+    h.update(img.tobytes())
+    return h.hexdigest()
+
+_encoded_images = _AssetCache(64 * 1024 * 1024, len)
+def encode_image(img: _Image.Image, *, compress_level: int = 6, cache: bool = False) -> str:
+    '''
+    Encodes an image as base64 png, which can be decoded by `decode_image()`.
+    `compress_level` goes from `0` (no compression, fastest) to `9` (smallest, slowest); every level is lossless,
+    so low levels are good for encodings which don't stick around, like the images in a generated script.
+
+    If `cache` is true, the result is cached by image content, so encoding the same (unchanged) image again is fast.
+    This is meant for images that are encoded over and over, like project costumes, not one-off images like camera frames
+    (which would just push the others out of the cache).
+    '''
+    def encode():
+        res = _io.BytesIO()
+        img.save(res, 'png', compress_level = compress_level)
+        return _base64.b64encode(res.getvalue()).decode('ascii')
+    if not cache: return encode()
+    return _encoded_images.get(f'{_image_digest(img)}:{compress_level}', encode)
 def decode_image(img: str) -> _Image.Image:
     raw = _base64.decodebytes(img.encode('ascii'))
     return _Image.open(_io.BytesIO(raw))
 
-def encode_sound(snd: _Sound.Sound) -> str:
+IMAGE_ATTACHMENT_KEY = '_pyblox_image'
+_RAW_IMAGE_MODES = { 'L', 'LA', 'RGB', 'RGBA' }
+def encode_image_raw(img: _Image.Image) -> Dict[str, Any]:
+    '''
+    Encodes an image as a json object holding its (zlib compressed) pixel buffer and dimensions.
+    This is much faster to encode and decode than a png, but only PyBlox understands it (see `decode_attachments()`).
+    '''
+    if img.mode not in _RAW_IMAGE_MODES:
+        img = img.convert('RGBA')
+    pixels = _np.asarray(img, dtype = _np.uint8).reshape(img.size[1], img.size[0], -1)
+    deltas = pixels.copy()
+    deltas[:, 1:] -= pixels[:, :-1] # difference from the pixel to the left (like png's sub filter), which compresses much better
+    data = _base64.b64encode(_zlib.compress(deltas.tobytes(), 1)).decode('ascii')
+    return { IMAGE_ATTACHMENT_KEY: { 'mode': img.mode, 'size': list(img.size), 'data': data } }
+def decode_image_raw(img: Dict[str, Any]) -> _Image.Image:
+    info = img[IMAGE_ATTACHMENT_KEY]
+    width, height = info['size']
+    deltas = _np.frombuffer(_zlib.decompress(_base64.b64decode(info['data'])), dtype = _np.uint8).reshape(height, width, -1)
+    pixels = _np.cumsum(deltas, axis = 1, dtype = _np.uint8) # wraps around, which undoes the (wrapping) differences
+    return _Image.frombytes(info['mode'], (width, height), pixels.tobytes())
+
+def decode_attachments(val: Any) -> Any:
+    '''
+    Replaces any raw image attachments (from `encode_image_raw()`) in a parsed json value with the images they encode.
+    '''
+    if isinstance(val, list):
+        return [decode_attachments(x) for x in val]
+    if isinstance(val, dict):
+        if IMAGE_ATTACHMENT_KEY in val: return decode_image_raw(val)
+        return { k: decode_attachments(v) for k, v in val.items() }
+    return val
+
+def encode_sound(snd: '_Sound.Sound') -> str:
     return _base64.b64encode(getattr(snd, '_Sound__raw', snd)).decode('ascii')
-def decode_sound(snd: str) -> _Sound.Sound:
+def decode_sound(snd: str) -> '_Sound.Sound':
+    from netsblox import sound as _Sound
     raw = _base64.decodebytes(snd.encode('ascii'))
     return _Sound.Sound(raw)
 
@@ -346,6 +600,150 @@ if __name__ == '__main__':
     test_roundtrip(' \nhello world\n\nf\n \t\r\n')
     test_roundtrip('\n\n\n\t\n \nhello world\n\nf\n \t\r\n\n\n')
 
+    assert_eq(small_json({ 'a': [1, 2.5, 'x', None, True], 'b': (3, 4) }), '{"a":[1,2.5,"x",null,true],"b":[3,4]}')
+    assert_eq(small_json({ 'arr': _np.arange(4), 'mat': _np.array([[1.5, 2], [3, 4]]), 'col': _np.arange(6).reshape(2, 3).T }), '{"arr":[0,1,2,3],"mat":[[1.5,2.0],[3.0,4.0]],"col":[[0,3],[1,4],[2,5]]}')
+    assert_eq(small_json([_np.int64(7), _np.float32(0.5), { 1, 2 }]) in ['[7,0.5,[1,2]]', '[7,0.5,[2,1]]'], True)
+    assert_eq(small_json({ 'big': 2 ** 70 }), '{"big":1180591620717411303424}')
+    class ArrayList(list): # a list subclass which keeps its items elsewhere (like compact snap lists)
+        def __iter__(self): return iter([1.5, 2.5])
+        def __array__(self, dtype = None, copy = None): return _np.array([1.5, 2.5], dtype = dtype)
+    assert_eq(small_json({ 'v': ArrayList(), 'w': [ArrayList()] }), '{"v":[1.5,2.5],"w":[[1.5,2.5]]}')
+    assert_eq(small_json([_Image.new('RGB', (2, 2))]).startswith('["<costume image=\\"data:image/png;base64,'), True)
+    assert_eq(parse_json(small_json({ 'x': [1, [2, 'three']], 'y': 'z' })), { 'x': [1, [2, 'three']], 'y': 'z' })
+    img = _Image.frombytes('RGB', (3, 2), bytes(range(18)))
+    raw = parse_json(small_json({ 'img': [img, _Image.new('P', (1, 1))], 'n': 1 }, images = 'raw'))
+    assert_eq(raw['img'][0][IMAGE_ATTACHMENT_KEY]['size'], [3, 2])
+    decoded = decode_attachments(raw)
+    assert_eq((decoded['img'][0].mode, decoded['img'][0].size, decoded['img'][0].tobytes()), ('RGB', (3, 2), bytes(range(18))))
+    assert_eq((decoded['img'][1].mode, decoded['n']), ('RGBA', 1))
+    gray = _Image.frombytes('L', (4, 3), bytes([0, 255, 1, 128] * 3))
+    assert_eq(decode_image_raw(encode_image_raw(gray)).tobytes(), gray.tobytes())
+    assert_eq(decode_attachments([1, ['a', { 'b': 2 }]]), [1, ['a', { 'b': 2 }]])
+    assert_eq(parse_json('[NaN]')[0] != parse_json('[NaN]')[0], True)
+    nonfinite = [_math.nan, _math.inf, -_math.inf, 2.5, _np.array([1.5, _math.nan]), { 'x': _np.float32('inf') }, { _math.nan }]
+    real_orjson, outputs = _orjson, []
+    for _orjson in [real_orjson, None]: # both backends write the same thing
+        outputs.append(small_json(nonfinite))
+        outputs.append(small_json([_math.nan, _math.inf, 2 ** 70])) # huge ints fall back to the builtin encoder even with orjson
+    _orjson = real_orjson
+    assert_eq(outputs, ['[null,null,null,2.5,[1.5,null],{"x":null},[null]]', '[null,null,1180591620717411303424]'] * 2)
+
+    assert_eq(prep_send(12), 12)
+    assert_eq(prep_send('hi'), 'hi')
+    assert_eq(prep_send(None), '')
+    assert_eq(prep_send((1, [2, None], { 'k': (3,) })), [1, [2, ''], [['k', [3]]]])
+    arr = _np.arange(3)
+    assert_eq(prep_send(arr) is arr, True)
+    detached = prep_send({ 'a': arr, 'b': [arr] }, detach = True)
+    assert_eq(detached[0][1] is arr or detached[1][1][0] is arr, False)
+    assert_eq(detached[0][1].tolist(), [0, 1, 2])
+    kept = prep_send([img], keep_images = True)
+    assert_eq(kept[0] is img, True)
+    kept = prep_send([img], detach = True, keep_images = True)
+    assert_eq((kept[0] is img, kept[0].tobytes() == img.tobytes()), (False, True))
+
+    import tempfile
+
+    loads = []
+    def loader(value, barrier = None):
+        def load():
+            loads.append(value)
+            if barrier is not None: barrier.wait() # only passes once every load waiting on it is running at the same time
+            return value
+        return load
+    cache = _AssetCache(10, len)
+    assert_eq([cache.get(k, loader(v)) for k, v in [('a', 'xxxx'), ('b', 'yyyy'), ('a', '????'), ('c', 'zzzz'), ('b', 'wwww'), ('d', 'x' * 11), ('a', '!!!!')]], ['xxxx', 'yyyy', 'xxxx', 'zzzz', 'wwww', 'x' * 11, '!!!!'])
+    assert_eq(loads, ['xxxx', 'yyyy', 'zzzz', 'wwww', 'x' * 11, '!!!!']) # b was least recently used when c was added, then a when b came back
+    assert_eq(cache.stats, { 'hits': 1, 'misses': 6, 'evictions': 3, 'entries': 2, 'size': 8 })
+
+    loads.clear()
+    cache = _AssetCache(1000, len)
+    barrier = _threading.Barrier(4, timeout = 10) # one load per distinct key
+    threads = [_threading.Thread(target = cache.get, args = (k, loader(k, barrier))) for k in ['same'] * 8 + ['k1', 'k2', 'k3']]
+    for t in threads: t.start()
+    for t in threads: t.join()
+    assert_eq((sorted(loads), barrier.broken, cache.stats['misses'], cache.stats['hits']), (['k1', 'k2', 'k3', 'same'], False, 4, 7)) # one load per key, all at the same time
+
+    attempts = []
+    def flaky():
+        attempts.append(1)
+        if len(attempts) == 1: raise RuntimeError('failed')
+        return 'ok'
+    try: cache.get('flaky', flaky)
+    except RuntimeError: pass
+    assert_eq((cache.get('flaky', flaky), cache.get('flaky', flaky), len(attempts)), ('ok', 'ok', 2)) # failures aren't cached
+
+    class FakeResponse:
+        def __init__(self, status_code, content, headers = {}):
+            self.status_code, self.content, self.headers = status_code, content, headers
+    requests_made = []
+    class FakeRequests:
+        version = 'v1'
+        offline = False
+        @staticmethod
+        def get(uri, headers = {}):
+            if FakeRequests.offline: raise ConnectionError('offline')
+            requests_made.append(uri)
+            if 'missing' in uri: return FakeResponse(404, b'')
+            if 'versioned' in uri:
+                if headers.get('If-None-Match') == FakeRequests.version: return FakeResponse(304, b'')
+                return FakeResponse(200, FakeRequests.version.encode('utf-8'), { 'ETag': FakeRequests.version })
+            return FakeResponse(200, uri.encode('utf-8'))
+    real_requests, _requests = _requests, FakeRequests
+    try:
+        with tempfile.TemporaryDirectory() as d:
+            set_download_cache(f'{d}/downloads')
+            assert_eq([load_text('https://example.com/a.json'), load_text('https://example.com/a.json'), _download('https://example.com/a.json')], [b'https://example.com/a.json'] * 2 + [(200, b'https://example.com/a.json')])
+            assert_eq([_download('https://example.com/missing')[0] for _ in range(2)], [404, 404])
+            assert_eq(requests_made, ['https://example.com/a.json', 'https://example.com/missing', 'https://example.com/missing']) # later runs use the download cache
+            assert_eq(len(_os.listdir(f'{d}/downloads')), 2) # content and validators
+
+            requests_made.clear()
+            set_download_cache(f'{d}/downloads', max_age = 0) # always check with the server
+            uri = 'https://example.com/versioned'
+            assert_eq([_download(uri), _download(uri)], [(200, b'v1')] * 2)
+            FakeRequests.version = 'v2'
+            assert_eq(_download(uri), (200, b'v2'))
+            FakeRequests.offline = True
+            assert_eq(_download(uri), (200, b'v2'))
+            assert_eq(requests_made, [uri] * 3)
+            FakeRequests.offline = False
+            set_download_cache(None)
+    finally:
+        _requests = real_requests
+
+    img = _Image.frombytes('RGB', (64, 48), bytes(range(256)) * 36)
+    hits = _encoded_images.stats['hits']
+    encoded = [encode_image(img, compress_level = level, cache = True) for level in [6, 1, 6, 0]]
+    assert_eq((_encoded_images.stats['hits'] - hits, encoded[0] == encoded[2], len(encoded[3]) > len(encoded[0])), (1, True, True))
+    misses = _encoded_images.stats['misses']
+    assert_eq((encode_image(img) == encoded[0], _encoded_images.stats['hits'] - hits, _encoded_images.stats['misses'] - misses), (True, 1, 0)) # one-off encodings skip the cache
+    assert_eq([decode_image(x).tobytes() == img.tobytes() for x in encoded], [True] * 4)
+    img.putpixel((3, 4), (1, 2, 3))
+    assert_eq((encode_image(img, cache = True) != encoded[0], decode_image(encode_image(img, cache = True)).getpixel((3, 4))), (True, (1, 2, 3)))
+    pal = _Image.new('P', (4, 4))
+    pal.putpalette([0, 0, 0] * 256)
+    black = encode_image(pal, cache = True)
+    pal.putpalette([255, 0, 0] * 256)
+    assert_eq((encode_image(pal, cache = True) != black, decode_image(encode_image(pal, cache = True)).convert('RGB').getpixel((0, 0))), (True, (255, 0, 0)))
+
+    barrier = _threading.Barrier(4, timeout = 10) # one request per distinct uri
+    class SlowRequests:
+        @staticmethod
+        def get(uri, headers = {}):
+            barrier.wait() # only passes once all the requests are running at the same time
+            return FakeRequests.get(uri, headers)
+    real_requests, _requests = _requests, SlowRequests
+    try:
+        progress = []
+        texts = [f'https://example.com/slow/{i}' for i in range(3)] + ['https://example.com/slow/0', 'https://example.com/missing']
+        requests_made.clear()
+        prefetch(texts = texts, images = ['netsblox://assets/img/logo/logo-256.png'], on_progress = lambda done, total: progress.append((done, total)))
+        assert_eq((sorted(progress), sorted(requests_made), barrier.broken), ([(i, 5) for i in range(1, 6)], sorted(set(texts)), False)) # duplicates are only loaded once, and all at the same time
+        assert_eq(([load_text(x) for x in texts[:3]], len(requests_made)), ([x.encode('utf-8') for x in texts[:3]], 4)) # already cached
+    finally:
+        _requests = real_requests
+
     if failures[0] != 0:
         print(f'FAILED TESTS: {failures[0]}', file = sys.stderr)
         sys.exit(1)
@@ -1,13 +1,26 @@
 import threading as _threading
 import traceback as _traceback
-import queue as _queue
+import collections as _collections
 import sys as _sys
 
+from typing import Optional, Literal
+
+OverflowPolicy = Literal['block', 'drop-oldest', 'drop-newest', 'coalesce-latest']
+OVERFLOW_POLICIES = ('block', 'drop-oldest', 'drop-newest', 'coalesce-latest')
+
+def check_overflow_policy(overflow: str) -> None:
+    if overflow not in OVERFLOW_POLICIES:
+        raise RuntimeError(f'Unknown overflow policy: \'{overflow}\'')
+
 class EventWrapper:
     def __init__(self, fn):
         self.__fn = fn
-        self.__queue = _queue.Queue()
+        self.__cv = _threading.Condition(_threading.Lock())
+        self.__queue = _collections.deque()
         self.__processing = False
+        self.__limit = None
+        self.__overflow = 'block'
+        self.__dropped = 0
 
         t = _threading.Thread(target = self.__process_queue)
         t.setDaemon(True)
@@ -16,18 +29,69 @@ class EventWrapper:
     def wrapped(self):
         return self.__fn
 
-    def schedule(self, *args, **kwargs) -> None:
-        self.__queue.put((args, kwargs))
+    def set_queue_limit(self, limit: Optional[int], overflow: OverflowPolicy = 'drop-oldest') -> None:
+        '''
+        Bounds the number of pending (scheduled but not yet started) calls, or removes the bound if `limit` is `None`.
+        `overflow` controls what happens when scheduling a call while full:
+        `'block'` waits for space, `'drop-newest'` discards the new call, `'drop-oldest'` discards the oldest pending call,
+        and `'coalesce-latest'` discards all pending calls so that only the newest is kept.
+        '''
+        check_overflow_policy(overflow)
+        with self.__cv:
+            self.__limit = max(limit, 1) if limit is not None else None
+            self.__overflow = overflow
+            self.__cv.notify_all()
+
+    @property
+    def dropped(self) -> int:
+        '''
+        The number of calls that were discarded due to the queue limit.
+        '''
+        with self.__cv:
+            return self.__dropped
+
+    def schedule(self, *args, **kwargs) -> int:
+        '''
+        Queues a call to the wrapped function and returns the number of calls which were discarded due to the queue limit.
+        '''
+        with self.__cv:
+            dropped = 0
+            limit = self.__limit
+            if limit is not None and len(self.__queue) >= limit:
+                overflow = self.__overflow
+                if overflow == 'block':
+                    while self.__limit is not None and len(self.__queue) >= self.__limit:
+                        self.__cv.wait()
+                elif overflow == 'drop-newest':
+                    self.__dropped += 1
+                    return 1
+                elif overflow == 'drop-oldest':
+                    self.__queue.popleft()
+                    dropped = 1
+                else:
+                    dropped = len(self.__queue)
+                    self.__queue.clear()
+                self.__dropped += dropped
+
+            self.__queue.append((args, kwargs))
+            self.__cv.notify_all()
+            return dropped
     def schedule_no_queueing(self, *args, **kwargs) -> None:
-        if not self.__processing and self.__queue.qsize() == 0:
-            self.__queue.put((args, kwargs))
+        with self.__cv:
+            if not self.__processing and not self.__queue:
+                self.__queue.append((args, kwargs))
+                self.__cv.notify_all()
 
     def __process_queue(self):
         while True:
             try:
-                self.__processing = False
-                args, kwargs = self.__queue.get()
-                self.__processing = True
+                with self.__cv:
+                    self.__processing = False
+                    while not self.__queue:
+                        self.__cv.wait()
+                    args, kwargs = self.__queue.popleft()
+                    self.__processing = True
+                    self.__cv.notify_all() # wake anyone blocked on a full queue
                 self.__fn(*args, **kwargs)
             except: # we can't stop, so just log the error so user can see it
                 print(_traceback.format_exc(), file = _sys.stderr) # print out directly so that the stdio wrappers are used
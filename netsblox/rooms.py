@@ -1,8 +1,11 @@
+import os
+import abc
 import time
 import atexit
 import threading
 import randomname
-from typing import Any, Optional, Dict, MutableSet, Literal, Tuple
+import netsblox.common as _common
+from typing import Any, Optional, Dict, MutableSet, Literal, Tuple, Callable
 
 LOGGING = False
 def log(*args, **kwargs):
@@ -11,6 +14,127 @@ def log(*args, **kwargs):
 def format_room_id(room_name: str) -> str:
     return f'_pyblox_room({room_name})'
 
+class RoomStorage(abc.ABC):
+    '''
+    Where room metadata is kept.
+    Values are stored by key and protected by an (optional) password.
+    Stored values come back in json form, so dicts are read as lists of key/value pairs and sets are read as lists.
+
+    `lock()` must give mutual exclusion on a key between all the handles using the (same) storage,
+    and `unlock()` must only release a lock held by the caller (otherwise it does nothing).
+    Errors should mention `not found` for missing keys and `incorrect password` for password mismatches.
+    '''
+
+    @abc.abstractmethod
+    def lock(self, key: str, password: Optional[str] = None) -> None:
+        ...
+    @abc.abstractmethod
+    def unlock(self, key: str, password: Optional[str] = None) -> None:
+        ...
+    @abc.abstractmethod
+    def get(self, key: str, password: Optional[str] = None) -> Any:
+        ...
+    @abc.abstractmethod
+    def set(self, key: str, value: Any, password: Optional[str] = None) -> None:
+        ...
+    @abc.abstractmethod
+    def delete(self, key: str, password: Optional[str] = None) -> None:
+        ...
+
+class CloudRoomStorage(RoomStorage):
+    '''
+    Room storage in NetsBlox cloud variables, which can be shared by any number of clients on any number of machines.
+    This is the default storage for rooms.
+    '''
+
+    def __init__(self, client: Any):
+        self.__client = client
+
+    def lock(self, key: str, password: Optional[str] = None) -> None:
+        self.__client.cloud_variables.lock_variable(key, password)
+    def unlock(self, key: str, password: Optional[str] = None) -> None:
+        self.__client.cloud_variables.unlock_variable(key, password)
+    def get(self, key: str, password: Optional[str] = None) -> Any:
+        return self.__client.cloud_variables.get_variable(key, password)
+    def set(self, key: str, value: Any, password: Optional[str] = None) -> None:
+        self.__client.cloud_variables.set_variable(key, value, password)
+    def delete(self, key: str, password: Optional[str] = None) -> None:
+        self.__client.cloud_variables.delete_variable(key, password)
+
+class LocalRoomStorage(RoomStorage):
+    '''
+    Room storage in the memory of the current process, which is useful for testing and for simulations with many clients in one process.
+    If `path` is given, the stored values are also saved to (and initially loaded from) that json file.
+    Locking only applies within this process, so the file should not be shared by several processes at once.
+    Locks are held by threads, so a key must be unlocked by the same thread that locked it.
+    '''
+
+    def __init__(self, path: Optional[str] = None):
+        self.__path = path
+        self.__lock = threading.Lock()
+        self.__entries: Dict[str, Dict[str, Any]] = {}
+        self.__key_locks: Dict[str, list] = {} # maps keys to [lock, number of threads holding or waiting for it] - removed when unused
+        self.__key_owners: Dict[str, int] = {} # maps locked keys to the thread holding the lock
+
+        if path is not None and os.path.exists(path):
+            with open(path, 'r') as f:
+                self.__entries = _common.parse_json(f.read())
+
+    def __check_assume_locked(self, key: str, password: Optional[str]) -> Dict[str, Any]:
+        entry = self.__entries.get(key)
+        if entry is None: raise RuntimeError(f'Variable \'{key}\' not found')
+        if entry['password'] != password: raise RuntimeError(f'Incorrect password for \'{key}\'')
+        return entry
+
+    def __save_assume_locked(self) -> None:
+        if self.__path is None: return
+        tmp = f'{self.__path}.tmp'
+        with open(tmp, 'w') as f:
+            f.write(_common.small_json(self.__entries))
+        os.replace(tmp, self.__path) # never leave a partially written file behind
+
+    def __release_assume_locked(self, key: str) -> None:
+        key_lock = self.__key_locks[key]
+        key_lock[0].release()
+        key_lock[1] -= 1
+        if key_lock[1] == 0: del self.__key_locks[key]
+
+    def lock(self, key: str, password: Optional[str] = None) -> None:
+        with self.__lock:
+            self.__check_assume_locked(key, password)
+            key_lock = self.__key_locks.setdefault(key, [threading.Lock(), 0])
+            key_lock[1] += 1
+        key_lock[0].acquire()
+        with self.__lock:
+            if key not in self.__entries: # deleted while we were waiting
+                self.__release_assume_locked(key)
+                self.__check_assume_locked(key, password)
+            self.__key_owners[key] = threading.get_ident()
+
+    def unlock(self, key: str, password: Optional[str] = None) -> None:
+        with self.__lock:
+            if self.__key_owners.get(key) != threading.get_ident(): return # not ours to release
+            del self.__key_owners[key]
+            self.__release_assume_locked(key)
+
+    def get(self, key: str, password: Optional[str] = None) -> Any:
+        with self.__lock:
+            return _common.parse_json(self.__check_assume_locked(key, password)['value'])
+
+    def set(self, key: str, value: Any, password: Optional[str] = None) -> None:
+        value = _common.small_json(_common.prep_send(value)) # same representation as cloud variables, and detached from the caller
+        with self.__lock:
+            if key in self.__entries:
+                self.__check_assume_locked(key, password)
+            self.__entries[key] = { 'password': password, 'value': value }
+            self.__save_assume_locked()
+
+    def delete(self, key: str, password: Optional[str] = None) -> None:
+        with self.__lock:
+            self.__check_assume_locked(key, password)
+            del self.__entries[key]
+            self.__save_assume_locked()
+
 class RcRoomHandle:
     '''
     A distributed reference-counted handle to pyblox room metadata.
@@ -20,22 +144,33 @@ class RcRoomHandle:
     After room creation, new handles may be created using the same room id and password,
     and will simply modify the reference counter atomically as needed.
     To ensure proper cleanup, you must call `destroy()` when the handle is no longer being used.
+
+    Every modification is a single transaction (lock, get, set, unlock), so the optional `update` functions
+    given to the constructor and `destroy()` are applied to the room roles in the same transaction as the reference counter.
+
+    The room is kept in `storage`, which defaults to the cloud variables of `client`.
     '''
 
-    def __init__(self, client: Any, room_id: str, password: Optional[str] = None, *, mode: Literal['create', 'join']):
+    def __init__(self, client: Any, room_id: str, password: Optional[str] = None, *, mode: Literal['create', 'join'],
+        update: Optional[Callable[[Dict[str, MutableSet[str]]], None]] = None, storage: Optional[RoomStorage] = None):
         self.__constructed = False
 
-        self.__client = client
+        self.__storage = storage if storage is not None else CloudRoomStorage(client)
         self.__id = room_id
         self.__password = password
 
         self.__destroyed = False
         self.__destroyed_lock = threading.Lock()
 
+        self.__metrics_lock = threading.Lock()
+        self.__metrics = { 'transactions': 0, 'requests': 0, 'request_time': 0.0, 'lock_wait_time': 0.0, 'transaction_time': 0.0 }
+
         if mode == 'create':
             try:
                 log('creating room', self.__id, 'pass:', self.__password)
-                self.__client.cloud_variables.set_variable(self.__id, [1, {}], self.__password)
+                roles = {}
+                if update is not None: update(roles)
+                self.__request('set', self.__id, [1, roles], self.__password)
             except Exception as e:
                 err = str(e).lower()
                 log('failed...', err)
@@ -44,11 +179,10 @@ class RcRoomHandle:
         elif mode == 'join':
             try:
                 log('incrementing room ref counter')
-                self.__client.cloud_variables.lock_variable(self.__id, self.__password)
-                raw = self.__client.cloud_variables.get_variable(self.__id, self.__password)
-                raw[0] += 1
-                self.__client.cloud_variables.set_variable(self.__id, raw, self.__password)
-                self.__client.cloud_variables.unlock_variable(self.__id, self.__password)
+                def join(raw):
+                    raw[0] += 1
+                    if update is not None: update(raw[1])
+                raw = self.__transaction(join)
                 log('new counter value', raw[0])
             except Exception as e:
                 err = str(e).lower()
@@ -61,7 +195,7 @@ class RcRoomHandle:
 
         self.__constructed = True
 
-    def destroy(self) -> None:
+    def destroy(self, update: Optional[Callable[[Dict[str, MutableSet[str]]], None]] = None) -> None:
         if not self.__constructed: return
 
         if self.__destroyed: return
@@ -70,45 +204,92 @@ class RcRoomHandle:
             self.__destroyed = True
 
         log('decrementing room ref counter')
-        self.__client.cloud_variables.lock_variable(self.__id, self.__password)
-        raw = self.__client.cloud_variables.get_variable(self.__id, self.__password)
-        raw[0] -= 1
-        self.__client.cloud_variables.set_variable(self.__id, raw, self.__password)
-        self.__client.cloud_variables.unlock_variable(self.__id, self.__password)
+        def leave(raw):
+            raw[0] -= 1
+            if update is not None: update(raw[1])
+        raw = self.__transaction(leave)
         log('new counter value', raw[0])
 
         if raw[0] == 0:
             log('deleting room')
-            self.__client.cloud_variables.delete_variable(self.__id, self.__password)
+            self.__request('delete', self.__id, self.__password)
 
-        self.__client = None
+        self.__storage = None
         self.__id = None
         self.__password = None
 
     def __del__(self) -> None:
         self.destroy()
 
+    @property
+    def metrics(self) -> Dict[str, float]:
+        '''
+        Counters for this handle: the number of transactions and storage requests, and the total time (in seconds)
+        spent in storage requests, waiting for the room lock, and in transactions.
+        '''
+        with self.__metrics_lock:
+            return dict(self.__metrics)
+
+    def __record(self, **amounts) -> None:
+        with self.__metrics_lock:
+            for k, v in amounts.items():
+                self.__metrics[k] += v
+
+    def __request(self, op: str, *args) -> Any:
+        start = time.time()
+        try:
+            return getattr(self.__storage, op)(*args)
+        finally:
+            t = time.time() - start
+            self.__record(requests = 1, request_time = t, **({ 'lock_wait_time': t } if op == 'lock' else {}))
+
+    def __fetch(self) -> Tuple[int, Dict[str, MutableSet[str]]]:
+        raw = self.__request('get', self.__id, self.__password)
+        return [raw[0], { k: set(v) for k, v in raw[1] }]
     def __impl_read(self) -> Tuple[int, Dict[str, MutableSet[str]]]:
         assert not self.__destroyed
-        raw = self.__client.cloud_variables.get_variable(self.__id, self.__password)
-        return [raw[0], { k: set(v) for k, v in raw[1] }]
+        return self.__fetch()
+
+    def __transaction(self, update: Callable[[list], None]) -> Tuple[int, Dict[str, MutableSet[str]]]:
+        # there is no compare-and-swap for room storage, so the lock is needed - but we only take it once per change
+        start = time.time()
+        self.__request('lock', self.__id, self.__password)
+        try:
+            raw = self.__fetch()
+            update(raw)
+            self.__request('set', self.__id, raw, self.__password)
+        finally:
+            self.__request('unlock', self.__id, self.__password)
+            self.__record(transactions = 1, transaction_time = time.time() - start)
+        return raw
 
     def read(self) -> Dict[str, MutableSet[str]]:
         return self.__impl_read()[1]
 
+    def update(self, update: Callable[[Dict[str, MutableSet[str]]], None]) -> Dict[str, MutableSet[str]]:
+        '''
+        Applies `update` to the room roles (in place) as a single transaction and returns the new roles.
+        '''
+        return self.__transaction(lambda raw: update(raw[1]))[1]
+
     def __enter__(self) -> Dict[str, MutableSet[str]]:
-        self.__client.cloud_variables.lock_variable(self.__id, self.__password)
+        self.__enter_time = time.time()
+        self.__request('lock', self.__id, self.__password)
         self.__cached = self.__impl_read()
         return self.__cached[1]
 
     def __exit__(self, *args, **kwargs) -> None:
-        self.__client.cloud_variables.set_variable(self.__id, self.__cached, self.__password)
-        self.__client.cloud_variables.unlock_variable(self.__id, self.__password)
-        self.__cached = None
+        try:
+            self.__request('set', self.__id, self.__cached, self.__password)
+        finally:
+            self.__request('unlock', self.__id, self.__password)
+            self.__record(transactions = 1, transaction_time = time.time() - self.__enter_time)
+            self.__cached = None
 
 class EditorRoomManager:
-    def __init__(self, *, get_client: Any):
+    def __init__(self, *, get_client: Any, storage: Optional[RoomStorage] = None):
         self.__get_client = get_client
+        self.__storage = storage
         self.__handle = None
         self.__room_name = None
         self.__room_password = None
@@ -118,6 +299,7 @@ class EditorRoomManager:
             self.__handle.destroy()
 
         self.__get_client = None
+        self.__storage = None
         self.__handle = None
         self.__room_name = None
         self.__room_password = None
@@ -137,62 +319,112 @@ class EditorRoomManager:
 
     def create_room(self, password: Optional[str] = None) -> None:
         room_name = randomname.get_name()
-        new_handle = RcRoomHandle(self.__get_client(), format_room_id(room_name), password, mode = 'create')
+        new_handle = RcRoomHandle(self.__get_client(), format_room_id(room_name), password, mode = 'create', storage = self.__storage)
 
-        if self.__handle is not None:
-            self.__handle.destroy()
+        self.__destroy_in_background(self.__handle)
 
         self.__handle = new_handle
         self.__room_name = room_name
         self.__room_password = password
 
     def join_room(self, room_name: str, password: Optional[str] = None) -> None:
-        new_handle = RcRoomHandle(self.__get_client(), format_room_id(room_name), password, mode = 'join')
+        new_handle = RcRoomHandle(self.__get_client(), format_room_id(room_name), password, mode = 'join', storage = self.__storage)
 
-        if self.__handle is not None:
-            self.__handle.destroy()
+        self.__destroy_in_background(self.__handle)
 
         self.__handle = new_handle
         self.__room_name = room_name
         self.__room_password = password
 
     def leave_room(self) -> None:
-        if self.__handle is not None:
-            self.__handle.destroy()
+        self.__destroy_in_background(self.__handle)
 
         self.__handle = None
         self.__room_name = None
         self.__room_password = None
 
+    @staticmethod
+    def __destroy_in_background(handle: Optional[RcRoomHandle]) -> None:
+        # leaving the old room is independent of anything else we do, so don't make the user wait for it
+        if handle is not None:
+            threading.Thread(target = handle.destroy, daemon = True).start()
+
 class RuntimeRoomManager:
-    CACHE_LIFETIME = 2 # seconds - keep low so little delay before new users are recognized
+    MEMBERSHIP_MSG_TYPE = '_pyblox_room_membership' # internal message type used to tell other room members about joining/leaving
+    POLL_INTERVAL = 60 # seconds between full re-reads of the role map, which drops members that crashed without leaving
 
-    def __init__(self, *, client: Any, role: str, room_id: str, password: Optional[str] = None):
+    def __init__(self, *, client: Any, role: str, room_id: str, password: Optional[str] = None, storage: Optional[RoomStorage] = None):
+        self.__client = client
         self.__role = role
         self.__pub_id = client.public_id
         self.__handle = None
-        self.__handle = RcRoomHandle(client, room_id, password, mode = 'join')
-
-        self.__cached_roles_expiry = 0
-        self.__cached_roles_lock = threading.Lock()
-        self.__cached_roles = None
-
-        with self.__handle as info:
+        self.__handlers = ()
+
+        # the role map is read from the room when other room members announce joining/leaving (and every so often)
+        self.__roles_lock = threading.Lock()
+        self.__roles = None # until we've joined - announcements received before then are remembered in __missed_early
+        self.__missed_early = False
+        self.__version = 0
+        self.__active = True
+        self.__missed_messages = False
+        self.__stopped = threading.Event()
+
+        def on_membership(event, role, addr):
+            self.__on_membership(event, role, addr)
+        def on_connection_state(state):
+            if state == 'reconnecting':
+                self.__missed_messages = True
+            elif state == 'connected' and self.__missed_messages:
+                self.__missed_messages = False
+                self.refresh_roles() # we may have missed membership messages while disconnected
+        # bursts of announcements (e.g., many members joining at once) only need one re-read
+        client.on_message(RuntimeRoomManager.MEMBERSHIP_MSG_TYPE, queue_limit = 1, overflow = 'coalesce-latest')(on_membership)
+        client.on_connection_state(on_connection_state)
+        self.__handlers = (on_membership, on_connection_state)
+
+        joined = []
+        def add_self(info):
             if role not in info:
                 info[role] = set()
             info[role].add(self.__pub_id)
+            joined.append(info)
+        self.__handle = RcRoomHandle(client, room_id, password, mode = 'join', update = add_self, storage = storage)
+        with self.__roles_lock:
+            self.__roles = joined[0]
+            self.__version += 1
+            missed_early, self.__missed_early = self.__missed_early, False
+        if missed_early: # these happened after our join transaction, so what we read might already be stale
+            self.refresh_roles()
+        self.__announce('join', joined[0])
+
+        poller = threading.Thread(target = self.__poll_roles)
+        poller.setDaemon(True)
+        poller.start()
 
         atexit.register(self.destroy)
 
     def destroy(self) -> None:
+        self.__stopped.set()
+        if self.__client is not None and self.__handlers:
+            on_membership, on_connection_state = self.__handlers
+            self.__client.remove_message_handler(RuntimeRoomManager.MEMBERSHIP_MSG_TYPE, on_membership)
+            self.__client.remove_connection_state_handler(on_connection_state)
+        self.__handlers = ()
+
         if self.__handle is not None:
-            with self.__handle as info:
-                bucket = info[self.__role]
-                bucket.remove(self.__pub_id)
+            self.__active = False
+            role, pub_id = self.__role, self.__pub_id
+            remaining = []
+            def remove_self(info):
+                bucket = info.get(role, set())
+                bucket.discard(pub_id)
                 if len(bucket) == 0:
-                    del info[self.__role]
-            self.__handle.destroy()
+                    info.pop(role, None)
+                remaining.append(info)
+            self.__handle.destroy(update = remove_self)
+            if remaining: self.__announce('leave', remaining[0])
 
+        self.__client = None
         self.__role = None
         self.__pub_id = None
         self.__handle = None
@@ -200,15 +432,63 @@ class RuntimeRoomManager:
     def __del__(self) -> None:
         self.destroy()
 
-    def get_roles(self) -> Dict[str, MutableSet[str]]:
-        now = time.time()
-        if now < self.__cached_roles_expiry:
-            return self.__cached_roles
+    @property
+    def metrics(self) -> Dict[str, float]:
+        '''
+        Timing metrics for the room operations done by this client (see `RcRoomHandle.metrics`).
+        '''
+        return self.__handle.metrics if self.__handle is not None else {}
 
-        with self.__cached_roles_lock:
-            if now < self.__cached_roles_expiry:
-                return self.__cached_roles
-            self.__cached_roles = self.__handle.read()
-            self.__cached_roles_expiry = time.time() + self.CACHE_LIFETIME
+    @property
+    def membership_version(self) -> int:
+        '''
+        A counter which changes whenever the role map (from `get_roles()`) changes.
+        '''
+        return self.__version
+
+    def __announce(self, event: str, roles: Dict[str, MutableSet[str]]) -> None:
+        others = [addr for addrs in roles.values() for addr in addrs if addr != self.__pub_id]
+        if others:
+            self.__client.send_message(RuntimeRoomManager.MEMBERSHIP_MSG_TYPE, others, event = event, role = self.__role, addr = self.__pub_id)
+
+    def __set_roles(self, roles: Dict[str, MutableSet[str]]) -> None:
+        with self.__roles_lock:
+            self.__roles = roles
+            self.__version += 1
+
+    def __on_membership(self, event: str, role: str, addr: str) -> None:
+        # anyone can send us an announcement, so it only tells us to re-read the room - the roles themselves always come from storage
+        if not self.__active or event not in ('join', 'leave'): return
+        with self.__roles_lock:
+            if self.__roles is None:
+                self.__missed_early = True
+                return
+            if (addr in self.__roles.get(role, ())) == (event == 'join'): return # already up to date
+        self.__try_refresh_roles()
+
+    def __poll_roles(self) -> None:
+        while not self.__stopped.wait(RuntimeRoomManager.POLL_INTERVAL):
+            self.__try_refresh_roles()
+
+    def __try_refresh_roles(self) -> None:
+        try:
+            self.refresh_roles()
+        except Exception as e: # e.g., we left the room in the meantime - the next refresh will try again anyway
+            log('failed to refresh room roles', e)
+
+    def refresh_roles(self) -> None:
+        '''
+        Re-reads the full role map from the room.
+        This is done automatically when other room members join or leave, after reconnecting, and every `POLL_INTERVAL` seconds.
+        '''
+        handle = self.__handle
+        if self.__active and handle is not None:
+            self.__set_roles(handle.read())
 
-        return self.__cached_roles
+    def get_roles(self) -> Dict[str, MutableSet[str]]:
+        '''
+        Gets the current map of role names to the addresses of the clients in that role.
+        This is kept up to date in the background, so it does not make any requests.
+        The returned value should not be modified.
+        '''
+        return self.__roles or {}
@@ -0,0 +1,264 @@
+'''
+A lightweight stand-in for the NetsBlox server which runs in a background thread of the current process.
+
+This implements just enough of the server (configuration, projects, network state, websocket messaging, and service calls)
+for a client to connect, exchange messages, and call RPCs without access to the public NetsBlox server.
+This is mostly useful for offline testing and load testing.
+
+```
+server = LocalServer().start()
+server.add_service('Echo', { 'echo': lambda value: value })
+
+nb = netsblox.Client(base_url = server.base_url)
+print(nb.call('Echo', 'echo', value = 'hello world'))
+```
+'''
+
+import asyncio as _asyncio
+import threading as _threading
+import inspect as _inspect
+import json as _json
+import uuid as _uuid
+
+import netsblox.common as _common
+
+from typing import Any, Callable, Dict, Optional
+
+try:
+    # aiohttp is only needed for the local server, so we don't require it otherwise
+    import aiohttp as _aiohttp
+    from aiohttp import web as _web
+except:
+    _aiohttp = None
+    _web = None
+
+class LocalServer:
+    '''
+    An in-process stand-in for the NetsBlox server.
+    Use `start()` to begin serving and `base_url` as the server address for a client.
+    RPCs are provided by services registered with `add_service()`.
+    '''
+
+    def __init__(self, *, host: str = '127.0.0.1', port: int = 0):
+        if _web is None:
+            raise RuntimeError('LocalServer requires aiohttp (pip install aiohttp)')
+
+        self.__host = host
+        self.__port = port
+        self.__loop = None
+        self.__thread = None
+
+        self.__services: Dict[str, Dict[str, Any]] = {}
+        self.__sockets: Dict[str, Any] = {}
+        self.__states: Dict[str, Any] = {}
+        self.__stats = { 'connections': 0, 'messages_routed': 0, 'messages_dropped': 0, 'rpc_calls': 0 }
+
+    def __enter__(self) -> 'LocalServer':
+        return self.start()
+    def __exit__(self, *args, **kwargs) -> None:
+        self.stop()
+
+    @property
+    def base_url(self) -> str:
+        '''
+        The address of the server, which can be used as the `base_url` of a client.
+        '''
+        return f'http://{self.__host}:{self.__port}'
+
+    @property
+    def stats(self) -> Dict[str, int]:
+        '''
+        Counters for connections, routed and dropped (no connected recipient) messages, and RPC calls.
+        '''
+        return dict(self.__stats)
+
+    def add_service(self, name: str, rpcs: Dict[str, Callable], *, description: str = '') -> None:
+        '''
+        Adds (or replaces) a service which clients can call.
+        `rpcs` maps RPC names to functions, which receive the RPC inputs as keyword arguments.
+        Non-string return values are sent back as json.
+        '''
+        info = { 'description': description, 'rpcs': {} }
+        for rpc, fn in rpcs.items():
+            params = _inspect.signature(fn).parameters.values()
+            info['rpcs'][rpc] = {
+                'fn': fn,
+                'args': [x for x in params if x.kind in (x.POSITIONAL_OR_KEYWORD, x.KEYWORD_ONLY)],
+                'varkw': any(x.kind == x.VAR_KEYWORD for x in params),
+            }
+        self.__services[name] = info
+
+    def start(self) -> 'LocalServer':
+        '''
+        Starts the server in a background thread and returns the server itself.
+        '''
+        assert self.__thread is None, 'server already started'
+
+        ready = _threading.Event()
+        errors = []
+        def run():
+            loop = _asyncio.new_event_loop()
+            _asyncio.set_event_loop(loop)
+            self.__loop = loop
+
+            try:
+                runner = _web.AppRunner(self.__make_app(), access_log = None)
+                loop.run_until_complete(runner.setup())
+                site = _web.TCPSite(runner, self.__host, self.__port)
+                loop.run_until_complete(site.start())
+                self.__port = runner.addresses[0][1]
+            except Exception as e: # e.g., the port is already in use - start() raises this for us
+                errors.append(e)
+                loop.close()
+                return
+            finally:
+                ready.set()
+
+            loop.run_forever()
+            loop.run_until_complete(runner.cleanup())
+            loop.close()
+
+        self.__thread = _threading.Thread(target = run, daemon = True)
+        self.__thread.start()
+        ready.wait()
+        if errors:
+            self.__thread.join()
+            self.__thread = None
+            self.__loop = None
+            raise errors[0]
+        return self
+
+    def stop(self) -> None:
+        '''
+        Stops the server, closing all client connections.
+        '''
+        if self.__thread is None: return
+        self.drop_connections() # otherwise shutdown waits for the websocket handlers to time out
+        self.__loop.call_soon_threadsafe(self.__loop.stop)
+        self.__thread.join()
+        self.__thread = None
+        self.__loop = None
+        self.__sockets.clear()
+
+    def drop_connections(self) -> None:
+        '''
+        Closes every client websocket (but keeps serving), which simulates a server restart from the perspective of the clients.
+        '''
+        async def close_all():
+            sockets = list(self.__sockets.values())
+            self.__sockets.clear()
+            for ws in sockets:
+                await ws.close()
+        _asyncio.run_coroutine_threadsafe(close_all(), self.__loop).result()
+
+    def __make_app(self) -> Any:
+        app = _web.Application()
+        app.router.add_get('/configuration', self.__configuration)
+        app.router.add_post('/projects/', self.__new_project)
+        app.router.add_post('/network/{client_id}/state', self.__set_state)
+        app.router.add_get('/network/{client_id}/connect', self.__connect)
+        app.router.add_get('/services', self.__services_list)
+        app.router.add_get('/services/input-types', self.__input_types)
+        app.router.add_get('/services/{service}', self.__service_info)
+        app.router.add_post('/services/{service}/{rpc}', self.__call)
+        return app
+
+    async def __configuration(self, request: Any) -> Any:
+        return _web.json_response({ 'servicesHosts': [{ 'url': f'{self.base_url}/services', 'categories': [] }], 'cloudUrl': self.base_url })
+
+    async def __new_project(self, request: Any) -> Any:
+        body = await request.json()
+        return _web.json_response({ 'id': str(_uuid.uuid4()), 'name': body.get('name'), 'roles': { str(_uuid.uuid4()): { 'name': 'myRole' } } })
+
+    async def __set_state(self, request: Any) -> Any:
+        self.__states[request.match_info['client_id']] = (await request.json()).get('state')
+        return _web.json_response({})
+
+    async def __services_list(self, request: Any) -> Any:
+        return _web.json_response([{ 'name': name } for name in sorted(self.__services.keys())])
+
+    async def __input_types(self, request: Any) -> Any:
+        return _web.json_response({})
+
+    async def __service_info(self, request: Any) -> Any:
+        name = request.match_info['service']
+        service = self.__services.get(name)
+        if service is None:
+            return _web.Response(status = 404, text = f'Service "{name}" is not available.')
+        return _web.json_response({
+            'servicePath': [name],
+            'description': service['description'],
+            'rpcs': { rpc: {
+                'description': _inspect.getdoc(info['fn']) or '',
+                'args': [{ 'name': x.name, 'optional': x.default is not x.empty } for x in info['args']],
+            } for rpc, info in service['rpcs'].items() },
+        })
+
+    async def __call(self, request: Any) -> Any:
+        service, rpc = request.match_info['service'], request.match_info['rpc']
+        info = self.__services.get(service, {}).get('rpcs', {}).get(rpc)
+        if info is None:
+            return _web.Response(status = 404, text = f'Unknown RPC: {service}.{rpc}')
+
+        args = await request.json()
+        if not info['varkw']:
+            names = { x.name for x in info['args'] }
+            args = { k: v for k, v in args.items() if k in names }
+
+        self.__stats['rpc_calls'] += 1
+        try:
+            res = await _asyncio.get_running_loop().run_in_executor(None, lambda: info['fn'](**args))
+        except Exception as e:
+            return _web.Response(status = 500, text = str(e))
+
+        if isinstance(res, str):
+            return _web.Response(text = res) # strings are returned unquoted, just like the real server
+        return _web.Response(text = _common.small_json(res), content_type = 'application/json')
+
+    def __resolve(self, addr: str) -> Optional[str]:
+        if addr in self.__sockets: return addr
+        tail = addr.rsplit('@', 1)[-1] # public ids look like project@client_id#app
+        return tail.split('#', 1)[0]
+
+    async def __connect(self, request: Any) -> Any:
+        client_id = request.match_info['client_id']
+        ws = _web.WebSocketResponse()
+        await ws.prepare(request)
+        self.__sockets[client_id] = ws
+        self.__stats['connections'] += 1
+        addrs = [client_id] # every address this socket is known by (see set-uuid)
+
+        try:
+            async for msg in ws:
+                if msg.type != _aiohttp.WSMsgType.TEXT: continue
+                try:
+                    message = _json.loads(msg.data)
+                except:
+                    continue
+
+                ty = message.get('type')
+                if ty == 'set-uuid':
+                    addr = message.get('clientId', client_id)
+                    self.__sockets[addr] = ws
+                    addrs.append(addr)
+                    await ws.send_str(_common.small_json({ 'type': 'connected' }))
+                elif ty == 'message':
+                    await self.__route(message)
+        finally:
+            for addr in addrs:
+                if self.__sockets.get(addr) is ws:
+                    del self.__sockets[addr]
+        return ws
+
+    async def __route(self, message: Dict[str, Any]) -> None:
+        dsts = message.get('dstId')
+        dsts = [dsts] if isinstance(dsts, str) else dsts or []
+
+        packet = _common.small_json(message)
+        for dst in dsts:
+            ws = self.__sockets.get(self.__resolve(dst))
+            if ws is None or ws.closed:
+                self.__stats['messages_dropped'] += 1
+                continue
+            await ws.send_str(packet)
+            self.__stats['messages_routed'] += 1
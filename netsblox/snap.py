@@ -2,41 +2,172 @@ import random
 import math
 import re
 import io
+import os
 import json
 import csv
 import itertools
+import functools
+import operator
+import numpy as np
 from PIL import Image
 
-from typing import Any, Union, Callable, Sequence
+from typing import Any, Union, Callable, Sequence, Optional
 
 import netsblox as _netsblox
 
 def _is_matrix(v: Any) -> bool:
-    return isinstance(v, list) and len(v) > 0 and isinstance(list.__getitem__(v, 0), list)
+    return isinstance(v, list) and len(v) > 0 and type(v) is not _CompactList and isinstance(list.__getitem__(v, 0), list)
 def _is_list(v: Any) -> bool:
     return isinstance(v, list)
+def _items(v: list) -> list:
+    # something list.__getitem__ can be used on (compact lists don't keep their items in the underlying list)
+    return list(v) if type(v) is _CompactList else v
 
-def _list_binary_op(a: Any, b: Any, op: Callable, matrix_mode: bool = True) -> 'List':
+def _list_binary_op(a: Any, b: Any, op: Callable, matrix_mode: bool = True, fast: Optional[Callable] = None) -> 'List':
     assert is_wrapped(a) and is_wrapped(b)
+    if fast is not None:
+        res = _fast_binary_op(a, b, fast)
+        if res is not None: return res
     checker = _is_matrix if matrix_mode else _is_list
     if checker(a):
+        ra = _items(a)
         if checker(b):
-            return List(_list_binary_op(wrap(list.__getitem__(a, i)), wrap(list.__getitem__(b, i)), op, matrix_mode) for i in range(min(len(a), len(b))))
-        return List(_list_binary_op(wrap(list.__getitem__(a, i)), b, op, matrix_mode) for i in range(len(a)))
+            rb = _items(b)
+            return List(_list_binary_op(wrap(list.__getitem__(ra, i)), wrap(list.__getitem__(rb, i)), op, matrix_mode, fast) for i in range(min(len(a), len(b))))
+        return List(_list_binary_op(wrap(list.__getitem__(ra, i)), b, op, matrix_mode, fast) for i in range(len(a)))
     if checker(b):
-        return List(_list_binary_op(a, wrap(list.__getitem__(b, i)), op, matrix_mode) for i in range(len(b)))
-    return _list_binary_op(a, b, op, False) if matrix_mode else op(a, b)
-def _list_unary_op(a: Any, op: Callable) -> 'List':
+        rb = _items(b)
+        return List(_list_binary_op(a, wrap(list.__getitem__(rb, i)), op, matrix_mode, fast) for i in range(len(b)))
+    return _list_binary_op(a, b, op, False, fast) if matrix_mode else op(a, b)
+def _list_unary_op(a: Any, op: Callable, fast: Optional[Callable] = None) -> 'List':
     assert is_wrapped(a)
     if _is_list(a):
-        return List(_list_unary_op(wrap(x), op) for x in a)
+        if fast is not None:
+            res = _fast_unary_op(a, fast)
+            if res is not None: return res
+        return List(_list_unary_op(wrap(x), op, fast) for x in a)
     return op(a)
 def _list_fold_op(a: Any, acc: Any, op: Callable) -> 'List':
     assert is_wrapped(acc) and is_wrapped(a) and _is_list(a)
+    ra = _items(a)
     for i in range(len(a)):
-        acc = op(acc, wrap(list.__getitem__(a, i)))
+        acc = op(acc, wrap(list.__getitem__(ra, i)))
     return acc
 
+# lists of numbers (or rectangular matrices of numbers) with at least this many items are handled by numpy (and stored compactly).
+# the numpy kernels give the same results as the element-wise ops (trig and log to within rounding),
+# and return None to fall back to them for anything they can't match exactly (e.g., errors).
+_NUMPY_MIN_SIZE = 64
+
+def _numeric_shape(v: Any) -> Optional[tuple]:
+    # the shape of a list of numbers or a rectangular matrix of numbers (or () for a number), otherwise None
+    t = type(v)
+    if t is Float: return ()
+    if t is _CompactList: return (len(v),)
+    if t is not List or len(v) == 0: return None
+    first = list.__getitem__(v, 0)
+    if type(first) is List or type(first) is _CompactList:
+        cols = len(first)
+        if cols == 0: return None
+        for row in list.__iter__(v):
+            rt = type(row)
+            if (rt is not List and rt is not _CompactList) or len(row) != cols: return None
+            if rt is List and set(map(type, list.__iter__(row))) != { Float }: return None
+        return (len(v), cols)
+    return (len(v),) if set(map(type, list.__iter__(v))) == { Float } else None
+def _to_array(v: Any, shape: tuple) -> np.ndarray:
+    # the result might share memory with v, so it must not be modified
+    if len(shape) == 0: return np.float64(v)
+    if len(shape) == 1: return v._array() if type(v) is _CompactList else np.fromiter(list.__iter__(v), dtype = np.float64, count = shape[0])
+    res = np.empty(shape, dtype = np.float64)
+    for i, row in enumerate(list.__iter__(v)):
+        res[i] = row._array() if type(row) is _CompactList else np.fromiter(list.__iter__(row), dtype = np.float64, count = shape[1])
+    return res
+
+def _from_array(arr: np.ndarray) -> 'List':
+    if arr.ndim >= 2: return List(_from_array(row) for row in arr)
+    if arr.dtype == np.bool_: return List(arr.tolist())
+    return _CompactList._from_array(arr.astype(np.float64, copy = False))
+
+def _fast_binary_op(a: Any, b: Any, kernel: Callable) -> Optional['List']:
+    if not isinstance(a, List) and not isinstance(b, List): return None # scalars are cheaper the normal way
+    sa, sb = _numeric_shape(a), _numeric_shape(b)
+    if sa is None or sb is None or max(np.prod(sa), np.prod(sb)) < _NUMPY_MIN_SIZE: return None
+    x, y = _to_array(a, sa), _to_array(b, sb)
+
+    # same rules as _list_binary_op: rows are paired up (truncated to the shorter list) and vectors are applied to each row of a matrix
+    if x.ndim == 2 and y.ndim == 2:
+        r, c = min(x.shape[0], y.shape[0]), min(x.shape[1], y.shape[1])
+        x, y = x[:r, :c], y[:r, :c]
+    elif x.ndim == 2 and y.ndim == 1:
+        k = min(x.shape[1], y.shape[0])
+        x, y = x[:, :k], y[None, :k]
+    elif x.ndim == 1 and y.ndim == 2:
+        k = min(x.shape[0], y.shape[1])
+        x, y = x[None, :k], y[:, :k]
+    elif x.ndim == 1 and y.ndim == 1:
+        k = min(x.shape[0], y.shape[0])
+        x, y = x[:k], y[:k]
+
+    with np.errstate(all = 'ignore'):
+        res = kernel(x, y)
+    return _from_array(res) if res is not None else None
+def _fast_unary_op(a: Any, kernel: Callable) -> Optional['List']:
+    shape = _numeric_shape(a)
+    if shape is None or np.prod(shape) < _NUMPY_MIN_SIZE: return None
+    with np.errstate(all = 'ignore'):
+        res = kernel(_to_array(a, shape))
+    return _from_array(res) if res is not None else None
+
+def _np_div(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    return np.where(b != 0, a / b, np.where(a == 0, np.nan, np.where(a > 0, np.inf, -np.inf))) # same as _float_div
+def _np_floordiv(a: np.ndarray, b: np.ndarray) -> Optional[np.ndarray]:
+    if not (np.isfinite(a).all() and np.isfinite(b).all() and (b != 0).all()): return None # errors and platform-dependent special cases
+    return np.floor_divide(a, b)
+def _np_pow(a: np.ndarray, b: np.ndarray) -> Optional[np.ndarray]:
+    # numpy's pow can differ from python's in the last digit, so we use python's (which is still much faster than the element-wise op)
+    a, b = np.broadcast_arrays(a, b)
+    try:
+        return np.array(list(map(operator.pow, a.ravel().tolist(), b.ravel().tolist())), dtype = np.float64).reshape(a.shape)
+    except (OverflowError, ZeroDivisionError, TypeError): # TypeError is from complex results
+        return None
+def _np_cmp(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    return (a > b).astype(np.int8) - (a < b) # same as _single_cmp, including NaN comparing equal to everything
+
+_np_gt = lambda a, b: _np_cmp(a, b) > 0
+_np_ge = lambda a, b: _np_cmp(a, b) >= 0
+_np_lt = lambda a, b: _np_cmp(a, b) < 0
+_np_le = lambda a, b: _np_cmp(a, b) <= 0
+
+def _np_unary(f: Callable, domain: Optional[Callable] = None) -> Callable:
+    # makes a unary kernel which falls back to the element-wise op for anything outside the domain (where it raises an error)
+    def kernel(x: np.ndarray) -> Optional[np.ndarray]:
+        if domain is not None and not domain(x).all(): return None
+        return f(x)
+    return kernel
+_np_rounding = lambda f: _np_unary(lambda x: f(x) + 0.0, np.isfinite) # + 0.0 turns -0.0 into 0.0, like converting through int does
+_np_neg = _np_unary(np.negative)
+_np_abs = _np_unary(np.abs)
+_np_round = _np_rounding(np.round)
+_np_trunc = _np_rounding(np.trunc)
+_np_ceil = _np_rounding(np.ceil)
+_np_floor = _np_rounding(np.floor)
+_np_pos = lambda x: x + 0.0 # like +Float, which turns -0.0 into 0
+_np_sqrt = _np_unary(lambda x: np.sqrt(_np_pos(x)), lambda x: ~(x < 0))
+_np_sin = _np_unary(lambda x: np.sin(_np_pos(x) * (math.pi / 180)), lambda x: ~np.isinf(x))
+_np_cos = _np_unary(lambda x: np.cos(_np_pos(x) * (math.pi / 180)), lambda x: ~np.isinf(x))
+_np_tan = _np_unary(lambda x: np.tan(_np_pos(x) * (math.pi / 180)), lambda x: ~np.isinf(x))
+_np_asin = _np_unary(lambda x: np.arcsin(_np_pos(x)) * (180 / math.pi), lambda x: ~(np.abs(x) > 1))
+_np_acos = _np_unary(lambda x: np.arccos(_np_pos(x)) * (180 / math.pi), lambda x: ~(np.abs(x) > 1))
+_np_atan = _np_unary(lambda x: np.arctan(_np_pos(x)) * (180 / math.pi))
+_np_sign = _np_unary(lambda x: _np_cmp(x, 0).astype(np.float64))
+
+def _np_log(a: np.ndarray, b: np.ndarray) -> Optional[np.ndarray]:
+    if ((a <= 0) | (b <= 0) | (b == 1)).any(): return None # math.log raises an error
+    return np.log(_np_pos(a)) / np.log(_np_pos(b))
+def _np_atan2(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    return np.arctan2(_np_pos(a), _np_pos(b)) * (180 / math.pi)
+
 def _scalar_op(a: Any, b: Any, op: Callable) -> 'Float':
     a, b = float(a), float(b)
     try:
@@ -45,15 +176,20 @@ def _scalar_op(a: Any, b: Any, op: Callable) -> 'Float':
         return Float(math.inf)
 
 def _single_cmp(a: Any, b: Any) -> int:
-    base = lambda x, y: 1 if x > y else -1 if x < y else 0
     try:
-        return base(float(a), float(b))
+        x, y = float(a), float(b)
     except:
-        return base(str(a), str(b))
+        x, y = str(a), str(b)
+    return 1 if x > y else -1 if x < y else 0
+_single_gt = lambda a, b: _single_cmp(a, b) > 0
+_single_ge = lambda a, b: _single_cmp(a, b) >= 0
+_single_lt = lambda a, b: _single_cmp(a, b) < 0
+_single_le = lambda a, b: _single_cmp(a, b) <= 0
 
 def _parse_index(idx: Any) -> Union['List', int, str, slice]:
     idx = wrap(idx)
     if type(idx) is List or type(idx) is slice: return idx
+    if type(idx) is _CompactList: return List(idx)
 
     try:
         x = +idx
@@ -71,6 +207,8 @@ def _float_div(a: Any, b: Any) -> 'Float':
     return Float(math.inf if a > 0 else -math.inf)
 
 class Float(float):
+    __slots__ = ()
+
     def __new__(cls, v: Any):
         try:
             return float.__new__(cls, v)
@@ -78,19 +216,30 @@ class Float(float):
             return float.__new__(cls, math.nan)
 
     def __eq__(self, other: Any) -> bool:
+        t = type(other)
+        if t is Float or t is float: return float.__eq__(self, other)
         if isinstance(other, str): return wrap(float(self) == float(other))
         return wrap(float(self) == other)
     def __ne__(self, other: Any) -> bool:
         return not (self == other)
 
+    # for two numbers, x > y is the same as _single_cmp(x, y) > 0 (even for NaN), but x >= y is not (x < y) rather than x >= y
     def __gt__(self, other: Any) -> Any:
-        return _list_binary_op(self, wrap(other), lambda a, b: _single_cmp(a, b) > 0)
+        t = type(other)
+        if t in _FAST_TYPES and (t is not int or -_EXACT_INT <= other <= _EXACT_INT): return float.__gt__(self, other)
+        return _list_binary_op(self, wrap(other), _single_gt, fast = _np_gt)
     def __ge__(self, other: Any) -> Any:
-        return _list_binary_op(self, wrap(other), lambda a, b: _single_cmp(a, b) >= 0)
+        t = type(other)
+        if t in _FAST_TYPES and (t is not int or -_EXACT_INT <= other <= _EXACT_INT): return not float.__lt__(self, other)
+        return _list_binary_op(self, wrap(other), _single_ge, fast = _np_ge)
     def __lt__(self, other: Any) -> Any:
-        return _list_binary_op(self, wrap(other), lambda a, b: _single_cmp(a, b) < 0)
+        t = type(other)
+        if t in _FAST_TYPES and (t is not int or -_EXACT_INT <= other <= _EXACT_INT): return float.__lt__(self, other)
+        return _list_binary_op(self, wrap(other), _single_lt, fast = _np_lt)
     def __le__(self, other: Any) -> Any:
-        return _list_binary_op(self, wrap(other), lambda a, b: _single_cmp(a, b) <= 0)
+        t = type(other)
+        if t in _FAST_TYPES and (t is not int or -_EXACT_INT <= other <= _EXACT_INT): return not float.__gt__(self, other)
+        return _list_binary_op(self, wrap(other), _single_le, fast = _np_le)
 
     def __str__(self) -> str:
         if math.isnan(self): return 'NaN'
@@ -98,55 +247,94 @@ class Float(float):
         return str(+self)
 
     def __bool__(self) -> bool:
-        return self != 0 and not math.isnan(self)
+        return float.__ne__(self, 0.0) and not math.isnan(self)
+
+    # plain numbers go straight to the float methods (which don't recurse back into Float),
+    # falling back to the general case for anything they can't handle the same way (overflow, complex results, division by zero)
 
     def __add__(self, other: Any) -> Any:
+        if type(other) in _FAST_TYPES:
+            try: return _make_float(float.__add__(self, other))
+            except OverflowError: pass
         other = wrap(other)
         if isinstance(other, List): return other.__radd__(self)
-        return _scalar_op(self, other, lambda a, b: a + b)
+        return _scalar_op(self, other, operator.add)
     def __radd__(self, other: Any) -> Any:
+        if type(other) in _FAST_TYPES:
+            try: return _make_float(float.__radd__(self, other))
+            except OverflowError: pass
         if not is_wrapped(other): return wrap(other) + self
-        return _scalar_op(other, self, lambda a, b: a + b)
+        return _scalar_op(other, self, operator.add)
 
     def __sub__(self, other: Any) -> Any:
+        if type(other) in _FAST_TYPES:
+            try: return _make_float(float.__sub__(self, other))
+            except OverflowError: pass
         other = wrap(other)
         if isinstance(other, List): return other.__rsub__(self)
-        return _scalar_op(self, other, lambda a, b: a - b)
+        return _scalar_op(self, other, operator.sub)
     def __rsub__(self, other: Any) -> Any:
+        if type(other) in _FAST_TYPES:
+            try: return _make_float(float.__rsub__(self, other))
+            except OverflowError: pass
         if not is_wrapped(other): return wrap(other) - self
-        return _scalar_op(other, self, lambda a, b: a - b)
+        return _scalar_op(other, self, operator.sub)
 
     def __mul__(self, other: Any) -> Any:
+        if type(other) in _FAST_TYPES:
+            try: return _make_float(float.__mul__(self, other))
+            except OverflowError: pass
         other = wrap(other)
         if isinstance(other, List): return other.__rmul__(self)
-        return _scalar_op(self, other, lambda a, b: a * b)
+        return _scalar_op(self, other, operator.mul)
     def __rmul__(self, other: Any) -> Any:
+        if type(other) in _FAST_TYPES:
+            try: return _make_float(float.__rmul__(self, other))
+            except OverflowError: pass
         if not is_wrapped(other): return wrap(other) * self
-        return _scalar_op(other, self, lambda a, b: a * b)
+        return _scalar_op(other, self, operator.mul)
 
     def __truediv__(self, other: Any) -> Any:
+        if type(other) in _FAST_TYPES:
+            try: return _make_float(float.__truediv__(self, other))
+            except (OverflowError, ZeroDivisionError): pass
         other = wrap(other)
         if isinstance(other, List): return other.__rtruediv__(self)
         return _scalar_op(self, other, _float_div)
     def __rtruediv__(self, other: Any) -> Any:
+        if type(other) in _FAST_TYPES:
+            try: return _make_float(float.__rtruediv__(self, other))
+            except (OverflowError, ZeroDivisionError): pass
         if not is_wrapped(other): return wrap(other) / self
         return _scalar_op(other, self, _float_div)
 
     def __floordiv__(self, other: Any) -> Any:
+        if type(other) in _FAST_TYPES:
+            try: return _make_float(float.__floordiv__(self, other))
+            except OverflowError: pass
         other = wrap(other)
         if isinstance(other, List): return other.__rfloordiv__(self)
-        return _scalar_op(self, other, lambda a, b: a // b)
+        return _scalar_op(self, other, operator.floordiv)
     def __rfloordiv__(self, other: Any) -> Any:
+        if type(other) in _FAST_TYPES:
+            try: return _make_float(float.__rfloordiv__(self, other))
+            except OverflowError: pass
         if not is_wrapped(other): return wrap(other) // self
-        return _scalar_op(other, self, lambda a, b: a // b)
+        return _scalar_op(other, self, operator.floordiv)
 
     def __pow__(self, other: Any) -> Any:
+        if type(other) in _FAST_TYPES:
+            try: return _make_float(float.__pow__(self, other))
+            except (OverflowError, TypeError): pass
         other = wrap(other)
         if isinstance(other, List): return other.__rpow__(self)
-        return _scalar_op(self, other, lambda a, b: a ** b)
+        return _scalar_op(self, other, operator.pow)
     def __rpow__(self, other: Any) -> Any:
+        if type(other) in _FAST_TYPES:
+            try: return _make_float(float.__rpow__(self, other))
+            except (OverflowError, TypeError): pass
         if not is_wrapped(other): return wrap(other) ** self
-        return _scalar_op(other, self, lambda a, b: a ** b)
+        return _scalar_op(other, self, operator.pow)
 
     def __neg__(self) -> 'Float':
         return Float(-float(self))
@@ -166,7 +354,13 @@ class Float(float):
     def __floor__(self) -> 'Float':
         return Float(math.floor(float(self)))
 
+_make_float = functools.partial(float.__new__, Float) # skips the parsing in Float.__new__, for values known to be floats
+_FAST_TYPES = { Float, float, int } # operands of the Float fast paths
+_EXACT_INT = 2 ** 53 # beyond this, ints compare differently than their (rounded) float values
+
 class Str(str):
+    __slots__ = ()
+
     def __getitem__(self, idx: Any) -> str:
         idx = _parse_index(idx)
         t = type(idx)
@@ -186,13 +380,13 @@ class Str(str):
         return not (self == other)
 
     def __gt__(self, other: Any) -> Any:
-        return _list_binary_op(self, wrap(other), lambda a, b: _single_cmp(a, b) > 0)
+        return _list_binary_op(self, wrap(other), _single_gt, fast = _np_gt)
     def __ge__(self, other: Any) -> Any:
-        return _list_binary_op(self, wrap(other), lambda a, b: _single_cmp(a, b) >= 0)
+        return _list_binary_op(self, wrap(other), _single_ge, fast = _np_ge)
     def __lt__(self, other: Any) -> Any:
-        return _list_binary_op(self, wrap(other), lambda a, b: _single_cmp(a, b) < 0)
+        return _list_binary_op(self, wrap(other), _single_lt, fast = _np_lt)
     def __le__(self, other: Any) -> Any:
-        return _list_binary_op(self, wrap(other), lambda a, b: _single_cmp(a, b) <= 0)
+        return _list_binary_op(self, wrap(other), _single_le, fast = _np_le)
 
     def __add__(self, other: Any) -> Any:
         return Float(self) + other
@@ -252,6 +446,56 @@ class Str(str):
     def rand(self) -> 'Str':
         return wrap(str.__getitem__(self, random.randrange(len(self))) if len(self) != 0 else '')
 
+def _text_number(x: str) -> Optional[float]:
+    # the number a text compares equal to, if any
+    try:
+        f = float(x)
+        return f if f == f else None
+    except ValueError:
+        return None
+
+class _ListIndex:
+    # the position of the first occurrence of each number and text in a list, for finding them without a linear search.
+    # Snap equality isn't transitive (e.g., '5' == 5 == '5.0' but '5' != '5.0'), so numbers and texts are indexed separately
+    __slots__ = ('numbers', 'texts', 'numeric_texts', 'has_bools')
+
+    def __init__(self, items: Sequence[Any]):
+        self.numbers, self.texts, self.numeric_texts = {}, {}, {}
+        self.has_bools = False
+        for i, x in enumerate(items):
+            if type(x) is bool: # equal to 0/1 but not to '0'/'1' (unlike numbers), so these lists are just searched linearly
+                self.has_bools = True
+                return
+            if isinstance(x, str):
+                self.texts.setdefault(x.lower(), i)
+                f = _text_number(x)
+                if f is not None: self.numeric_texts.setdefault(f, i)
+            elif isinstance(x, (int, float)):
+                try:
+                    f = float(x)
+                except OverflowError:
+                    continue # huge ints are NaN to Snap
+                if f == f: self.numbers.setdefault(f, i)
+
+    def find(self, value: Any) -> Optional[int]:
+        # position of the first item equal to value (or -1), or None if value isn't a number or text (or the list has bools)
+        if self.has_bools:
+            return None
+        if isinstance(value, str):
+            hits = [self.texts.get(value.lower())]
+            f = _text_number(value)
+            if f is not None: hits.append(self.numbers.get(f))
+        elif isinstance(value, (int, float)):
+            try:
+                f = float(value)
+            except OverflowError:
+                return -1
+            hits = [self.numbers.get(f), self.numeric_texts.get(f)]
+        else:
+            return None
+        hits = [x for x in hits if x is not None]
+        return min(hits) if len(hits) != 0 else -1
+
 class List(list):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
@@ -259,19 +503,23 @@ class List(list):
         # these are volatile - we don't persist them on e.g. list concat and they don't count toward size, indexing, etc.
         self.__str_keys = {}
 
+        # None after any change, then the number of searches (index or in) since then, and finally the built _ListIndex (see __find)
+        self.__index = None
+
     def __bool__(self) -> bool:
         return True
 
     def __gt__(self, other: Any) -> Any:
-        return _list_binary_op(self, wrap(other), lambda a, b: _single_cmp(a, b) > 0)
+        return _list_binary_op(self, wrap(other), _single_gt, fast = _np_gt)
     def __ge__(self, other: Any) -> Any:
-        return _list_binary_op(self, wrap(other), lambda a, b: _single_cmp(a, b) >= 0)
+        return _list_binary_op(self, wrap(other), _single_ge, fast = _np_ge)
     def __lt__(self, other: Any) -> Any:
-        return _list_binary_op(self, wrap(other), lambda a, b: _single_cmp(a, b) < 0)
+        return _list_binary_op(self, wrap(other), _single_lt, fast = _np_lt)
     def __le__(self, other: Any) -> Any:
-        return _list_binary_op(self, wrap(other), lambda a, b: _single_cmp(a, b) <= 0)
+        return _list_binary_op(self, wrap(other), _single_le, fast = _np_le)
 
     def __delitem__(self, idx: Any) -> None:
+        self.__index = None
         idx = _parse_index(idx)
         t = type(idx)
         if t is slice: list.__delitem__(self, idx)
@@ -294,6 +542,7 @@ class List(list):
             else: return wrap('')
         else: assert False
     def __setitem__(self, idx: Any, value: Any):
+        self.__index = None
         value = wrap(value)
         idx = _parse_index(idx)
         t = type(idx)
@@ -310,61 +559,83 @@ class List(list):
         else: assert False
 
     def __iter__(self) -> Sequence[Any]:
-        return (wrap(x) for x in list.__iter__(self))
+        return map(wrap, list.__iter__(self))
 
     def __add__(self, other: Any) -> 'List':
-        return _list_binary_op(self, wrap(other), lambda a, b: a + b)
+        return _list_binary_op(self, wrap(other), operator.add, fast = np.add)
     def __radd__(self, other: Any) -> 'List':
-        return _list_binary_op(wrap(other), self, lambda a, b: a + b)
+        return _list_binary_op(wrap(other), self, operator.add, fast = np.add)
 
     def __sub__(self, other: Any) -> 'List':
-        return _list_binary_op(self, wrap(other), lambda a, b: a - b)
+        return _list_binary_op(self, wrap(other), operator.sub, fast = np.subtract)
     def __rsub__(self, other: Any) -> 'List':
-        return _list_binary_op(wrap(other), self, lambda a, b: a - b)
+        return _list_binary_op(wrap(other), self, operator.sub, fast = np.subtract)
 
     def __mul__(self, other: Any) -> 'List':
-        return _list_binary_op(self, wrap(other), lambda a, b: a * b)
+        return _list_binary_op(self, wrap(other), operator.mul, fast = np.multiply)
     def __rmul__(self, other: Any) -> 'List':
-        return _list_binary_op(wrap(other), self, lambda a, b: a * b)
+        return _list_binary_op(wrap(other), self, operator.mul, fast = np.multiply)
 
     def __truediv__(self, other: Any) -> 'List':
-        return _list_binary_op(self, wrap(other), lambda a, b: a / b)
+        return _list_binary_op(self, wrap(other), lambda a, b: a / b, fast = _np_div)
     def __rtruediv__(self, other: Any) -> 'List':
-        return _list_binary_op(wrap(other), self, lambda a, b: a / b)
+        return _list_binary_op(wrap(other), self, lambda a, b: a / b, fast = _np_div)
 
     def __floordiv__(self, other: Any) -> 'List':
-        return _list_binary_op(self, wrap(other), lambda a, b: a // b)
+        return _list_binary_op(self, wrap(other), operator.floordiv, fast = _np_floordiv)
     def __rfloordiv__(self, other: Any) -> 'List':
-        return _list_binary_op(wrap(other), self, lambda a, b: a // b)
+        return _list_binary_op(wrap(other), self, operator.floordiv, fast = _np_floordiv)
 
     def __pow__(self, other: Any) -> 'List':
-        return _list_binary_op(self, wrap(other), lambda a, b: a ** b)
+        return _list_binary_op(self, wrap(other), operator.pow, fast = _np_pow)
     def __rpow__(self, other: Any) -> 'List':
-        return _list_binary_op(wrap(other), self, lambda a, b: a ** b)
+        return _list_binary_op(wrap(other), self, operator.pow, fast = _np_pow)
 
     def __neg__(self) -> 'List':
-        return List(-x for x in self)
+        return _fast_unary_op(self, _np_neg) or List(-x for x in self)
     def __abs__(self) -> 'List':
-        return List(abs(x) for x in self)
+        return _fast_unary_op(self, _np_abs) or List(abs(x) for x in self)
     def __round__(self) -> 'List':
-        return List(round(x) for x in self)
+        return _fast_unary_op(self, _np_round) or List(round(x) for x in self)
     def __trunc__(self) -> 'List':
-        return List(math.trunc(x) for x in self)
+        return _fast_unary_op(self, _np_trunc) or List(math.trunc(x) for x in self)
     def __ceil__(self) -> 'List':
-        return List(math.ceil(x) for x in self)
+        return _fast_unary_op(self, _np_ceil) or List(math.ceil(x) for x in self)
     def __floor__(self) -> 'List':
-        return List(math.floor(x) for x in self)
+        return _fast_unary_op(self, _np_floor) or List(math.floor(x) for x in self)
 
     def __iadd__(self, other: Any) -> 'List':
         return self + other
 
     def append(self, value) -> None:
+        self.__index = None
         list.append(self, wrap(value))
     def insert(self, idx, value) -> None:
+        self.__index = None
         list.insert(self, idx, wrap(value))
     def insert_rand(self, value) -> None:
+        self.__index = None
         list.insert(self, random.randrange(len(self)) if len(self) != 0 else 0, wrap(value))
 
+    # the other list modifications also need to invalidate the search index
+    def extend(self, values: Any) -> None:
+        self.__index = None
+        list.extend(self, values)
+    def remove(self, value: Any) -> None:
+        i = int(self.index(value))
+        if i < 0: raise ValueError('List.remove(x): x not in list')
+        self.__index = None
+        list.__delitem__(self, i)
+    def reverse(self) -> None:
+        self.__index = None
+        list.reverse(self)
+    def sort(self, *args, **kwargs) -> None:
+        self.__index = None
+        list.sort(self, *args, **kwargs)
+    def clear(self) -> None:
+        self.__index = None
+        list.clear(self)
+
     @property
     def rand(self) -> Any:
         if len(self) == 0: return wrap('')
@@ -381,6 +652,7 @@ class List(list):
     @last.setter
     def last(self, value):
         if len(self) == 0: return
+        self.__index = None
         list.__setitem__(self, -1, wrap(value))
 
     def reshaped(self, dims) -> Any:
@@ -397,20 +669,24 @@ class List(list):
             if y == 0: return wrap([])
             raw.append(y)
 
-        src = self.flat
-        if len(src) == 0:
-            src = wrap([''])
+        if len(raw) != 0:
+            shape = _numeric_shape(self)
+            if shape is not None and len(shape) != 0 and max(np.prod(shape), np.prod(raw)) >= _NUMPY_MIN_SIZE:
+                return _from_array(np.resize(_to_array(self, shape), raw)) # resize repeats the items to fill the new shape
+
+        def cycle():
+            # like itertools.cycle, but re-iterates the source instead of keeping a copy of it
+            while True:
+                empty = True
+                for x in self.xflat:
+                    empty = False
+                    yield x
+                if empty: yield wrap('')
+        src = cycle()
 
-        i = [0]
         def create(d):
-            if len(d) == 0:
-                r = src[i[0]]
-                i[0] += 1
-                if i[0] >= len(src):
-                    i[0] = 0
-                return r
-            else:
-                return [create(d[1:]) for _ in range(d[0])]
+            if len(d) == 0: return next(src)
+            return [create(d[1:]) for _ in range(d[0])]
         return wrap(create(raw))
 
     @property
@@ -420,6 +696,7 @@ class List(list):
             if depth >= len(res):
                 res.append(0)
             res[depth] = max(res[depth], len(v))
+            if type(v) is _CompactList: return # no nested lists, so don't bother boxing the items
             for x in v:
                 if _is_list(x):
                     visitor(x, depth + 1)
@@ -427,51 +704,262 @@ class List(list):
         return wrap(res)
     @property
     def flat(self) -> 'List':
-        res = []
-        def visitor(v):
-            for x in v:
-                if _is_list(x):
-                    visitor(x)
-                else:
-                    res.append(x)
-        visitor(self)
-        return wrap(res)
+        return wrap(list(self.xflat))
+    @property
+    def xflat(self) -> Sequence[Any]:
+        '''
+        Generates the non-list items of this (possibly nested) list in order, as they would appear in `flat`,
+        without building the flattened list.
+        '''
+        for x in self:
+            if _is_list(x):
+                yield from x.xflat
+            else:
+                yield x
     @property
     def T(self) -> 'List':
+        shape = _numeric_shape(self)
+        if shape is not None and len(shape) == 2 and np.prod(shape) >= _NUMPY_MIN_SIZE:
+            return _from_array(_to_array(self, shape).T)
+        return List(self.xT)
+    @property
+    def xT(self) -> Sequence['List']:
+        '''
+        Generates the rows of `T` (the transpose of this list) one at a time, without building the whole transposed list.
+        '''
         columns = max([0, *[len(x) if _is_list(x) else 1 for x in self]])
-        res = []
         for column in range(columns):
-            inner = []
-            for row in self:
-                inner.append(row[column] if _is_list(row) else row)
-            res.append(inner)
-        return wrap(res)
+            yield wrap([row[column] if _is_list(row) else row for row in self])
 
     @property
     def csv(self):
         res = io.StringIO()
-        writer = csv.writer(res, lineterminator = '')
+        self.write_csv(res)
+        return wrap(res.getvalue())
+    def write_csv(self, file: Any) -> None:
+        '''
+        Writes this list as csv (the same as the `csv` property) to a file-like object or a file path, one row at a time.
+        '''
+        if isinstance(file, str):
+            with open(file, 'w', newline = '') as f:
+                return self.write_csv(f)
+
+        writer = csv.writer(file, lineterminator = '')
         if any(_is_list(x) for x in self):
             for i, row in enumerate(self):
-                if i != 0: res.write('\n')
+                if i != 0: file.write('\n')
                 writer.writerow(row)
         else:
             writer.writerow(self)
-        return wrap(res.getvalue())
 
     def pop(self) -> Any:
         if len(self) == 0: return wrap('')
+        self.__index = None
         res = wrap(list.__getitem__(self, -1))
         list.__delitem__(self, -1)
         return res
 
-    def index(self, *args, **kwargs) -> Float:
+    def __find(self, value: Any) -> Optional[int]:
+        # position of the first item equal to value (or -1) using the search index, or None if a linear search is needed.
+        # the index is only built for large lists which are searched more than once without changes in between
+        idx = self.__index
+        if type(idx) is not _ListIndex:
+            idx = (idx or 0) + 1
+            if idx < 2 or len(self) < _INDEX_MIN_SIZE:
+                self.__index = idx
+                return None
+            idx = self.__index = _ListIndex(list.__iter__(self))
+        return idx.find(value)
+
+    def __linear_find(self, value: Any, start: int = 0, stop: Optional[int] = None) -> int:
+        for i in range(*slice(start, stop).indices(len(self))):
+            try:
+                if list.__getitem__(self, i) == value: return i
+            except ValueError:
+                pass # non-numeric text compared to a number, which is just not equal
+        return -1
+
+    def __contains__(self, value: Any) -> bool:
+        res = self.__find(value)
+        return (res if res is not None else self.__linear_find(value)) >= 0
+    def index(self, value: Any, *args) -> Float:
+        res = self.__find(value) if len(args) == 0 else None
+        return Float(res if res is not None else self.__linear_find(value, *args))
+
+class _CompactList(List):
+    '''
+    A List of numbers which keeps its items in a float64 array instead of as separate Float objects (which are created on access).
+    Lists of many numbers are stored like this automatically (see `wrap`), and the numpy fast paths work on the array directly.
+    Storing anything other than a number (or using an operation that needs the items as objects) turns this into a normal List, in place.
+    '''
+
+    def __init__(self, values: Any = ()):
+        super().__init__()
+        self.__buf = np.empty(0, dtype = np.float64)
+        self.__len = 0
+        self.extend(values)
+
+    @staticmethod
+    def _from_array(arr: np.ndarray) -> '_CompactList':
+        res = _CompactList()
+        res.__buf = arr
+        res.__len = len(arr)
+        return res
+    def _array(self) -> np.ndarray:
+        return self.__buf[:self.__len]
+
+    def __degrade(self) -> None:
+        items = list(map(_make_float, self._array().tolist()))
+        del self.__buf, self.__len
+        self.__class__ = List
+        list.extend(self, items)
+
+    def __reserve(self, n: int) -> None:
+        if n > len(self.__buf):
+            buf = np.empty(max(n, 2 * len(self.__buf), 8), dtype = np.float64)
+            buf[:self.__len] = self._array()
+            self.__buf = buf
+
+    def __array__(self, dtype: Any = None, copy: Any = None) -> np.ndarray:
+        return np.array(self._array(), dtype = dtype) # always a copy, so the list can't be modified through it
+    def __reduce__(self) -> Any:
+        state = { k: v for k, v in self.__dict__.items() if not k.startswith('_CompactList__') }
+        return _CompactList._from_array, (self._array().copy(),), state
+    def __sizeof__(self) -> int:
+        return super().__sizeof__() + self.__buf.nbytes
+    def __repr__(self) -> str:
+        return repr(list(self))
+
+    def __len__(self) -> int:
+        return self.__len
+    def __iter__(self) -> Sequence[Any]:
+        return map(_make_float, self._array().tolist())
+    def __reversed__(self) -> Sequence[Any]:
+        return map(_make_float, self._array()[::-1].tolist())
+    @staticmethod
+    def __number(value: Any) -> Optional[float]:
+        # the float the items are compared to (same as Float.__eq__), or None if value can't equal any number
+        if not isinstance(value, (int, float, str)): return None
         try:
-            return Float(list.index(self, *args, **kwargs))
-        except ValueError:
-            return Float(-1)
+            return float(value)
+        except (ValueError, OverflowError):
+            return None # non-numeric text (which is just not equal) or an int too big to equal any float
+
+    def __contains__(self, value: Any) -> bool:
+        x = self.__number(value)
+        return x is not None and bool((self._array() == x).any())
+
+    def __eq__(self, other: Any) -> bool:
+        return list(self) == (list(other) if type(other) is _CompactList else other)
+    def __ne__(self, other: Any) -> bool:
+        return not (self == other)
+
+    def __getitem__(self, idx: Any) -> Any:
+        idx = _parse_index(idx)
+        t = type(idx)
+        if t is int and 0 <= idx < self.__len: return _make_float(self.__buf[idx])
+        if t is slice: return _CompactList._from_array(self._array()[idx].copy())
+        return super().__getitem__(idx)
+    def __setitem__(self, idx: Any, value: Any) -> None:
+        value = wrap(value)
+        pidx = _parse_index(idx)
+        t = type(pidx)
+        if t is int and 0 <= pidx < self.__len and type(value) is Float:
+            self.__buf[pidx] = value
+        elif t is int and pidx == self.__len and type(value) is Float:
+            self.append(value)
+        elif t is str or t is List or (t is int and pidx < 0):
+            super().__setitem__(pidx, value)
+        else:
+            self.__degrade()
+            List.__setitem__(self, pidx, value)
+    def __delitem__(self, idx: Any) -> None:
+        pidx = _parse_index(idx)
+        t = type(pidx)
+        if t is int and 0 <= pidx < self.__len:
+            self.__buf[pidx:self.__len - 1] = self.__buf[pidx + 1:self.__len]
+            self.__len -= 1
+        elif t is slice:
+            self.__buf = np.delete(self._array(), np.arange(self.__len)[pidx])
+            self.__len = len(self.__buf)
+        elif t is not int or pidx < 0:
+            super().__delitem__(pidx)
+
+    def append(self, value: Any) -> None:
+        value = wrap(value)
+        if type(value) is not Float:
+            self.__degrade()
+            return List.append(self, value)
+        self.__reserve(self.__len + 1)
+        self.__buf[self.__len] = value
+        self.__len += 1
+    def extend(self, values: Any) -> None:
+        values = list(values)
+        if set(map(type, values)) <= _COMPACT_TYPES:
+            self.__reserve(self.__len + len(values))
+            try:
+                self.__buf[self.__len:self.__len + len(values)] = values
+                self.__len += len(values)
+                return
+            except OverflowError:
+                pass # ints too big for floats
+        self.__degrade()
+        list.extend(self, values)
+    def insert(self, idx: int, value: Any) -> None:
+        value = wrap(value)
+        if type(value) is not Float:
+            self.__degrade()
+            return List.insert(self, idx, value)
+        idx = max(0, min(self.__len, idx + self.__len if idx < 0 else idx)) # same as list.insert
+        self.__reserve(self.__len + 1)
+        self.__buf[idx + 1:self.__len + 1] = self.__buf[idx:self.__len].copy()
+        self.__buf[idx] = value
+        self.__len += 1
+    def insert_rand(self, value: Any) -> None:
+        self.insert(random.randrange(self.__len) if self.__len != 0 else 0, value)
+    def pop(self) -> Any:
+        if self.__len == 0: return wrap('')
+        self.__len -= 1
+        return _make_float(self.__buf[self.__len])
+    def clear(self) -> None:
+        self.__len = 0
+    def copy(self) -> list:
+        return list(self)
+    def count(self, value: Any) -> int:
+        return list(self).count(value)
+    def reverse(self) -> None:
+        self.__buf[:self.__len] = self._array()[::-1].copy()
+    def remove(self, value: Any) -> None:
+        self.__degrade()
+        list.remove(self, value)
+    def sort(self, *args, **kwargs) -> None:
+        self.__degrade()
+        list.sort(self, *args, **kwargs)
 
-_listify = lambda v: List(wrap(x) for x in v)
+    @property
+    def last(self) -> Any:
+        if self.__len == 0: return wrap('')
+        return _make_float(self.__buf[self.__len - 1])
+    @last.setter
+    def last(self, value):
+        if self.__len != 0: self[self.__len - 1] = value
+
+    def index(self, value: Any, start: int = 0, stop: Optional[int] = None) -> Float:
+        x = self.__number(value)
+        if x is None: return Float(-1)
+        start, stop, _ = slice(start, stop).indices(self.__len) # same bounds as List.index
+        hits = np.flatnonzero(self.__buf[start:stop] == x) if start < stop else ()
+        return Float(hits[0] + start) if len(hits) != 0 else Float(-1)
+
+_COMPACT_TYPES = { int, float, Float }
+_INDEX_MIN_SIZE = 256 # smaller lists are searched linearly
+def _listify(v: Any) -> 'List':
+    if len(v) >= _NUMPY_MIN_SIZE and set(map(type, v)) <= _COMPACT_TYPES:
+        try:
+            return _CompactList._from_array(np.fromiter(v, dtype = np.float64, count = len(v)))
+        except OverflowError:
+            pass # ints too big for floats, which Float turns into NaN
+    return List(wrap(x) for x in v)
 _wrappers = { int: Float, float: Float, str: Str, list: _listify, tuple: _listify, set: _listify, dict: lambda v: List(wrap(x) for x in v.items()) }
 def wrap(value: Any) -> Any:
     '''
@@ -485,12 +973,35 @@ def is_wrapped(value: Any) -> bool:
     '''
     return type(value) == type(wrap(value))
 
+_rng = np.random.default_rng()
+def seed(value: Any = None) -> None:
+    '''
+    Seeds the random number generators used by `rand` (and other random operations, like `List.rand`),
+    so that the same sequence of random values is produced each time the program is run with the same seed.
+    If no seed is given, uses a fresh (unpredictable) seed.
+    '''
+    global _rng
+    random.seed(value)
+    _rng = np.random.default_rng(random.getrandbits(64) if value is not None else None)
+
+def _np_rand(a: np.ndarray, b: np.ndarray) -> Optional[np.ndarray]:
+    # same as the single case of rand, but for every pair of items at once
+    if not (np.isfinite(a).all() and np.isfinite(b).all()) or max(np.abs(a).max(), np.abs(b).max()) >= 2 ** 62: return None # errors or out of range
+    a, b = np.broadcast_arrays(np.minimum(a, b), np.maximum(a, b))
+    ints = (np.trunc(a) == a) & (np.trunc(b) == b)
+    res = a + _rng.random(a.shape) * (b - a)
+    if ints.any():
+        res[ints] = _rng.integers(a[ints].astype(np.int64), b[ints].astype(np.int64), endpoint = True)
+    return np.where(a == b, a, res) + 0.0
+
 def rand(a: Any, b: Any) -> Union[Float, List]:
     '''
     Returns a random number in the range `[a, b]`.
 
     If both `a` and `b` are integer-valued (including floats holding integer values), returns an integer.
     Otherwise, returns a float in the continuous range.
+
+    Use `seed` to make the results reproducible.
     '''
     def single(a, b):
         a, b = +wrap(a), +wrap(b)
@@ -501,7 +1012,12 @@ def rand(a: Any, b: Any) -> Union[Float, List]:
         if ai == a and bi == b:
             return wrap(random.randint(ai, bi))
         return wrap(a + random.random() * (b - a))
-    return _list_binary_op(wrap(a), wrap(b), single)
+    return _list_binary_op(wrap(a), wrap(b), single, fast = _np_rand)
+
+def _range_params(a: Any, b: Any) -> tuple:
+    # the start, step, and length of srange(a, b)
+    a, b = +wrap(a), +wrap(b)
+    return a, (1 if b > a else -1), math.floor(abs(b - a)) + 1
 
 def sxrange(a: Any, b: Any) -> Sequence[Any]:
     '''
@@ -514,9 +1030,8 @@ def sxrange(a: Any, b: Any) -> Sequence[Any]:
     whereas `sxrange(1, 1000000)` simply generates the numbers one at a times as needed.
     '''
     def single(a, b):
-        a, b = +wrap(a), +wrap(b)
-        step = 1 if b > a else -1
-        return (a + wrap(i * step) for i in range(math.floor(abs(b - a)) + 1))
+        a, step, n = _range_params(a, b)
+        return (a + wrap(i * step) for i in range(n))
     return _list_binary_op(wrap(a), wrap(b), single)
 def srange(a: Any, b: Any) -> List:
     '''
@@ -526,7 +1041,11 @@ def srange(a: Any, b: Any) -> List:
 
     Equivalent to collecting all of the sequences returned by `sxrange` into lists.
     '''
-    return _list_unary_op(sxrange(a, b), List)
+    def single(a, b):
+        a, step, n = _range_params(a, b)
+        if n < _NUMPY_MIN_SIZE: return List(a + wrap(i * step) for i in range(n))
+        return _CompactList._from_array(np.arange(n, dtype = np.float64) * step + a) # same items, but without a Float per item
+    return _list_binary_op(wrap(a), wrap(b), single)
 
 def combinations(*sources: Any) -> Sequence[Any]:
     '''
@@ -539,30 +1058,60 @@ def combinations(*sources: Any) -> Sequence[Any]:
     if len(sources) == 0: return wrap([])
     return wrap(list(itertools.product(*sources)))
 
+class _Combinations:
+    # a lazy view of the items of combinations(*sources), see xcombinations
+    def __init__(self, sources: list):
+        self.__sources = sources
+        self.__len = math.prod(len(x) for x in sources) if len(sources) != 0 else 0
+
+    def __len__(self) -> int:
+        return self.__len
+    def __iter__(self) -> Sequence['List']:
+        if self.__len == 0: return iter(())
+        return map(wrap, itertools.product(*self.__sources))
+    def __getitem__(self, idx: int) -> 'List':
+        idx = operator.index(idx)
+        if idx < 0: idx += self.__len
+        if not 0 <= idx < self.__len: raise IndexError('combination index out of range')
+
+        res = []
+        for src in reversed(self.__sources): # the last source varies fastest
+            idx, i = divmod(idx, len(src))
+            res.append(src[i])
+        return wrap(res[::-1])
+
+def xcombinations(*sources: Any) -> Sequence['List']:
+    '''
+    Returns the same combinations as `combinations`, but without creating all of them up front.
+    The result can be iterated or indexed (e.g., `xcombinations(a, b)[1000]`) and supports `len`,
+    but combinations are only created as they are accessed.
+    '''
+    return _Combinations([list(x) for x in wrap(sources)])
+
 def log(value: Any, base: Any) -> Any:
-    return _list_binary_op(wrap(value), wrap(base), lambda x, y: wrap(math.log(+x, +y)))
+    return _list_binary_op(wrap(value), wrap(base), lambda x, y: wrap(math.log(+x, +y)), fast = _np_log)
 
 def sqrt(value: Any) -> Any:
-    return _list_unary_op(wrap(value), lambda x: wrap(math.sqrt(+x)))
+    return _list_unary_op(wrap(value), lambda x: wrap(math.sqrt(+x)), fast = _np_sqrt)
 def lnot(value: Any) -> Any:
     return _list_unary_op(wrap(value), lambda x: not x)
 
 def sin(value: Any) -> Any:
-    return _list_unary_op(wrap(value), lambda x: wrap(math.sin(+x * (math.pi / 180))))
+    return _list_unary_op(wrap(value), lambda x: wrap(math.sin(+x * (math.pi / 180))), fast = _np_sin)
 def cos(value: Any) -> Any:
-    return _list_unary_op(wrap(value), lambda x: wrap(math.cos(+x * (math.pi / 180))))
+    return _list_unary_op(wrap(value), lambda x: wrap(math.cos(+x * (math.pi / 180))), fast = _np_cos)
 def tan(value: Any) -> Any:
-    return _list_unary_op(wrap(value), lambda x: wrap(math.tan(+x * (math.pi / 180))))
+    return _list_unary_op(wrap(value), lambda x: wrap(math.tan(+x * (math.pi / 180))), fast = _np_tan)
 
 def asin(value: Any) -> Any:
-    return _list_unary_op(wrap(value), lambda x: wrap(math.asin(+x) * (180 / math.pi)))
+    return _list_unary_op(wrap(value), lambda x: wrap(math.asin(+x) * (180 / math.pi)), fast = _np_asin)
 def acos(value: Any) -> Any:
-    return _list_unary_op(wrap(value), lambda x: wrap(math.acos(+x) * (180 / math.pi)))
+    return _list_unary_op(wrap(value), lambda x: wrap(math.acos(+x) * (180 / math.pi)), fast = _np_acos)
 def atan(value: Any) -> Any:
-    return _list_unary_op(wrap(value), lambda x: wrap(math.atan(+x) * (180 / math.pi)))
+    return _list_unary_op(wrap(value), lambda x: wrap(math.atan(+x) * (180 / math.pi)), fast = _np_atan)
 
 def atan2(y: Any, x: Any) -> Any:
-    return _list_binary_op(wrap(y), wrap(x), lambda a, b: wrap(math.atan2(+a, +b) * (180 / math.pi)))
+    return _list_binary_op(wrap(y), wrap(x), lambda a, b: wrap(math.atan2(+a, +b) * (180 / math.pi)), fast = _np_atan2)
 
 def get_ord(value: Any) -> Any:
     return _list_unary_op(wrap(value), lambda x: wrap(ord(str(x))))
@@ -570,7 +1119,7 @@ def get_chr(value: Any) -> Any:
     return _list_unary_op(wrap(value), lambda x: wrap(chr(+x)))
 
 def sign(value: Any) -> Any:
-    return _list_unary_op(wrap(value), lambda x: wrap(_single_cmp(x, wrap(0))))
+    return _list_unary_op(wrap(value), lambda x: wrap(_single_cmp(x, wrap(0))), fast = _np_sign)
 
 def identical(a: Any, b: Any) -> Any:
     a, b = wrap(a), wrap(b)
@@ -581,7 +1130,7 @@ def identical(a: Any, b: Any) -> Any:
 
 def prod(vals: Any) -> Any:
     vals = wrap(vals)
-    if type(vals) is List: return _list_fold_op(vals, wrap(1), lambda x, y: x * y)
+    if isinstance(vals, List): return _list_fold_op(vals, wrap(1), lambda x, y: x * y)
     else: return vals
 
 def split(src: Any, by: Any) -> List:
@@ -599,6 +1148,52 @@ def split_words(src: Any) -> List:
 def split_json(src: Any) -> List:
     return _list_unary_op(wrap(src), lambda x: wrap(json.loads(str(x))))
 
+def _open_text(src: Any) -> Any:
+    # a text stream for a file path or a (text or binary) file-like object, and whether we opened it (and should close it)
+    if isinstance(src, (str, os.PathLike)): return open(src, encoding = 'utf-8', newline = ''), True
+    if isinstance(src.read(0), bytes): return io.TextIOWrapper(src, encoding = 'utf-8', newline = ''), False
+    return src, False
+
+_CSV_NUMBER = re.compile(r'[+-]?(\d+\.?\d*|\.\d+)([eE][+-]?\d+)?') # plain numbers only (float also takes '1_000', ' 5', 'inf', 'nan', ...)
+def _csv_cell(cell: str) -> Any:
+    return Float(float(cell)) if _CSV_NUMBER.fullmatch(cell) else Str(cell)
+
+def read_csv(src: Any, *, numbers: bool = False) -> List:
+    '''
+    Reads csv from a file path or a (text or binary) file-like object, giving the same result as `split_csv` on its content
+    (except that quoted cells may contain line breaks).
+    Rows are read and converted one at a time, so the content is never held as a single string.
+
+    If `numbers` is true, cells holding plain numbers (like `12`, `-0.5` or `1e3`, with no padding) are converted to numbers (otherwise all cells are text).
+    Rows of many numbers are then stored compactly (see `wrap`).
+    '''
+    f, owned = _open_text(src)
+    try:
+        cell = _csv_cell if numbers else Str
+        res = List()
+        for row in csv.reader(f):
+            row = list(map(cell, row)) # already wrapped, so only long rows need to go through wrap (to possibly be made compact)
+            res.append(List(row) if len(row) < _NUMPY_MIN_SIZE else _listify(row))
+    finally:
+        if owned: f.close()
+        elif isinstance(f, io.TextIOWrapper): f.detach() # don't close the caller's stream
+    return res[0] if len(res) == 1 else res
+
+def _json_pairs(pairs: list) -> List:
+    return List(List((wrap(k), wrap(v))) for k, v in dict(pairs).items()) # same as wrapping the dict (the last duplicate key wins)
+def read_json(src: Any) -> Any:
+    '''
+    Reads json from a file path or a (text or binary) file-like object, giving the same result as `split_json` on its content.
+    Objects are created directly as their wrapped type (rather than as a dict which is then wrapped),
+    and lists of many numbers are stored compactly (see `wrap`).
+    '''
+    f, owned = _open_text(src)
+    try:
+        return wrap(json.load(f, object_pairs_hook = _json_pairs))
+    finally:
+        if owned: f.close()
+        elif isinstance(f, io.TextIOWrapper): f.detach()
+
 def is_number(value: Any) -> bool:
     if isinstance(value, bool): return False
     try:
@@ -620,6 +1215,12 @@ def is_sound(value: Any) -> bool:
     return isinstance(value, _netsblox.sound.Sound)
 
 if __name__ == '__main__':
+    import copy
+    import pickle
+    import sys
+    import inspect
+    import tempfile
+
     assert is_wrapped(True)
     v = wrap('hello world') ; assert v is wrap(v) and isinstance(v, Str) and isinstance(v, str)
     v = wrap(1223847982) ; assert v is wrap(v) and isinstance(v, Float) and isinstance(v, float)
@@ -1048,4 +1649,160 @@ if __name__ == '__main__':
 
     assert math.isnan(+wrap('{}'))
 
+    def same(a, b, tol = 0.0):
+        if isinstance(a, list) or isinstance(b, list):
+            return isinstance(a, List) and isinstance(b, List) and len(a) == len(b) and all(same(x, y, tol) for x, y in zip(a, b))
+        if type(a) is not type(b): return False
+        if type(a) is not Float: return a == b
+        if math.isnan(a) or math.isnan(b): return math.isnan(a) and math.isnan(b)
+        if float(a) == float(b): return math.copysign(1, a) == math.copysign(1, b)
+        return abs(a - b) <= tol * max(1, abs(a))
+    def slow(f):
+        global _NUMPY_MIN_SIZE
+        size, _NUMPY_MIN_SIZE = _NUMPY_MIN_SIZE, math.inf
+        try: return f()
+        finally: _NUMPY_MIN_SIZE = size
+    def outcome(f):
+        try: return True, f()
+        except Exception as e: return False, type(e)
+    def check_same(f1, f2, tol = 0.0):
+        (ok1, res1), (ok2, res2) = outcome(f1), outcome(f2)
+        assert ok1 == ok2 and (same(res1, res2, tol) if ok1 else res1 is res2), (res1, res2)
+    def check_fast(f, tol = 0.0):
+        check_same(lambda: slow(f), f, tol)
+
+    rng = random.Random(0)
+    specials = [0, -0.0, 1, -1, 2, -2, 0.5, -0.5, 1.5, 90, 180, -270, 1e308, -1e308, 1e-308, math.inf, -math.inf, math.nan]
+    pool = lambda n, extra = specials: wrap([rng.choice(extra) if rng.random() < 0.3 else rng.choice([rng.uniform(-10, 10), rng.randint(-5, 5)]) for _ in range(n)])
+    va, vb, vs = pool(300), pool(250), pool(9)
+    ma, mb = wrap([pool(12) for _ in range(20)]), wrap([pool(10) for _ in range(15)])
+    assert _fast_binary_op(va, vb, np.add) is not None and _fast_binary_op(ma, vs, np.add) is not None and _fast_unary_op(ma, _np_neg) is not None
+    assert _fast_binary_op(wrap([*va, 'x']), vb, np.add) is None and _fast_binary_op(wrap([[1] * 100, [2] * 99]), 1, np.add) is None
+    for x, y in [(va, vb), (vb, va), (va, wrap(3)), (wrap('-2.5'), va), (ma, mb), (ma, vs), (vs, mb), (ma, wrap(0)), (va, ma)]:
+        for f in [lambda: x + y, lambda: x - y, lambda: x * y, lambda: x / y, lambda: x // y, lambda: x ** y, lambda: x > y, lambda: x >= y, lambda: x < y, lambda: x <= y]:
+            check_fast(f)
+        check_fast(lambda: atan2(x, y), 1e-12)
+        check_fast(lambda: log(abs(x) + 2, abs(y) + 2), 1e-12)
+    for x in [va, ma, abs(va), pool(100, [0.5, -0.5, 1, -1, math.nan]), pool(100, [0.5, 3.25, -2.5, math.nan])]:
+        for f in [lambda: -x, lambda: abs(x), lambda: round(x), lambda: math.trunc(x), lambda: math.ceil(x), lambda: math.floor(x), lambda: sign(x), lambda: sqrt(x)]:
+            check_fast(f)
+        for f in [lambda: sin(x), lambda: cos(x), lambda: tan(x), lambda: asin(x), lambda: acos(x), lambda: atan(x)]:
+            check_fast(f, 1e-12)
+    assert outcome(lambda: wrap(list(range(1, 101))) // 0)[1] is ZeroDivisionError
+    for a, b in [(1, 1000), (wrap('5.25'), -300.5), (0, -99), (-2 ** 60, -2 ** 60 + 200), (wrap([2, 0.5]), wrap([300, -100]))]:
+        check_same(lambda: srange(a, b), lambda: _list_unary_op(sxrange(a, b), List))
+    assert type(srange(1, 1000)) is _CompactList and type(srange(1, 10)) is List
+
+    for lo, hi in [(pool(300, [0.5, 3, -2]), pool(250, [1, 2.5])), (wrap([pool(12, [4]) for _ in range(20)]), 7), (wrap([1, 2.5] * 50), wrap([6] * 100)), (wrap(list(range(100))), wrap(list(range(100, 0, -1))))]:
+        seed(42); r1 = rand(lo, hi)
+        seed(42); r2 = rand(lo, hi)
+        check_same(lambda: r1, lambda: r2)
+        assert _numeric_shape(r1) == _numeric_shape(slow(lambda: rand(lo, hi)))
+    r = rand(wrap([1, 2.5, 3, -2] * 50), wrap([6, 2.5, 3.5, -5] * 50))
+    assert type(r) is _CompactList and all(x in [1, 2, 3, 4, 5, 6] for x in r[0::4]) and all(x == 2.5 for x in r[1::4])
+    assert all(3 <= x <= 3.5 and x != int(x) for x in r[2::4]) and all(x in [-5, -4, -3, -2] for x in r[3::4]) and len(set(map(float, r[0::4]))) > 1
+    assert outcome(lambda: rand(wrap([*range(100), math.nan]), 5))[1] is ValueError
+    seed(); assert rand(1, 10 ** 9) != rand(1, 10 ** 9)
+
+    for sources in [(), ([1, 2],), ([1, 2], [3, 4]), ([1, 2], [], [3, 4]), ([1, 2, 3], 'ab', [[4], [5, 6]], [7, 8])]:
+        v = xcombinations(*sources)
+        assert len(v) == len(combinations(*sources)) and list(v) == combinations(*sources) and [v[i] for i in range(len(v))] == combinations(*sources)
+        assert all(is_wrapped(x) for x in v) and (len(v) == 0 or v[-1] == combinations(*sources).last)
+    v = xcombinations(range(1000), range(1000), range(1000))
+    assert len(v) == 10 ** 9 and v[123456789] == [123, 456, 789] and outcome(lambda: v[10 ** 9])[1] is IndexError
+
+    with tempfile.TemporaryDirectory() as d:
+        rows = [['id', 'name', 'score'], *([str(i), f'item "{i}", ok', f'{i * 0.5}'] for i in range(200)), ['1e3', 'NaN', ' 7 ', '']]
+        with open(f'{d}/t.csv', 'w', newline = '') as f: csv.writer(f).writerows(rows)
+        with open(f'{d}/t.csv', newline = '') as f: content = f.read()
+        for src in [f'{d}/t.csv', io.StringIO(content), io.BytesIO(content.encode('utf-8'))]:
+            v = read_csv(src)
+            assert v == split_csv(content) and all(type(x) is Str for x in v.flat)
+            if isinstance(src, io.IOBase): assert not src.closed
+        v = read_csv(f'{d}/t.csv', numbers = True)
+        assert v[0] == ['id', 'name', 'score'] and v[5] == [4, 'item "4", ok', 2] and type(v[5][0]) is Float and type(v[5][1]) is Str and v.last == [1000, 'NaN', ' 7 ', '']
+        v = read_csv(io.StringIO('1_000, 5,inf,nan,+.5,-2.,2.5e3,1e'), numbers = True)
+        assert [type(x) for x in v] == [Str] * 4 + [Float] * 3 + [Str] and v[4:7] == [0.5, -2, 2500]
+        assert read_csv(io.StringIO('1,2,3')) == [1, 2, 3] and read_csv(io.StringIO('')) == [] and type(read_csv(io.StringIO(','.join(map(str, range(100)))), numbers = True)) is _CompactList
+
+        obj = { 'a': [1, 2.5, 'x', None, True, { 'b': [] }], 'c': list(range(100)), 'd': 10 ** 400, 'e': 1e400 }
+        with open(f'{d}/t.json', 'w') as f: json.dump(obj, f)
+        for src in [f'{d}/t.json', io.StringIO(json.dumps(obj)), io.BytesIO(json.dumps(obj).encode('utf-8'))]:
+            check_same(lambda: read_json(src), lambda: split_json(json.dumps(obj)))
+        v = read_json(f'{d}/t.json')
+        assert type(v[1][1]) is _CompactList and all(is_wrapped(x) for x in list.__iter__(v[0])) and read_json(io.StringIO('"hi"')) == 'hi'
+        check_same(lambda: read_json(io.StringIO('{"a": 1, "b": 2, "a": [3]}')), lambda: split_json('{"a": 1, "b": 2, "a": [3]}'))
+
+    def linear_index(v, value):
+        def eq(x):
+            try: return bool(x == value)
+            except ValueError: return False # comparing non-numeric text to a number
+        return next((i for i, x in enumerate(v) if eq(x)), -1)
+    items = [*range(300), 'Hello', 'hello', 'HeLLo', '5', '5.0', ' 6 ', 'nan', 'inf', 1e400, math.nan, True, False, [1, 2], '', 'x', '12']
+    v = wrap([rng.choice(items) for _ in range(1000)])
+    queries = [wrap(x) for x in items] + ['HELLO', '5', '5.00', wrap('299'), 299.0, -0.0, 2 ** 2000, 'missing', 1000, None, [1, 2], wrap([1, 2])]
+    edits = [lambda: v.append('new'), lambda: v.insert(0, 'HELLO'), lambda: v.insert_rand(7), lambda: v.extend(wrap(['a', 5])), lambda: v.pop(), lambda: v.reverse(),
+        lambda: v.sort(key = str), lambda: v.remove(v[10]), lambda: v.__setitem__(3, 'missing'), lambda: v.__delitem__(0), lambda: setattr(v, 'last', 1000), lambda: v.clear()]
+    for edit in [lambda: None, *edits]:
+        edit()
+        for _ in range(2): # the second time uses the index
+            for q in queries:
+                assert v.index(q) == linear_index(v, q) and (q in v) == (linear_index(v, q) >= 0), q
+    v = wrap([str(i) for i in range(1000)])
+    assert v.index(500) == 500 and v._List__index == 1 and v.index('500') == 500 and type(v._List__index) is _ListIndex and v.index(500, 0, 10) == -1 and v.index(5, 3) == 5
+    v.append('x')
+    assert v._List__index is None and 'x' in v and wrap(['a', 'b', 1]).index(1) == 2 and outcome(lambda: wrap(['a', 'b']).remove('c'))[1] is ValueError
+
+    nums = [*specials, 3, -7, 0.1, 1e-320, 2 ** 53 + 1, -2 ** 60, 2 ** 2000, -2 ** 2000, Float(2.5), Float(-0.0), Float(math.nan)]
+    for a in [x for x in nums if type(x) is not int]:
+        for b in nums:
+            for op, fn in [(operator.add, operator.add), (operator.sub, operator.sub), (operator.mul, operator.mul), (operator.truediv, _float_div), (operator.floordiv, operator.floordiv), (operator.pow, operator.pow)]:
+                check_same(lambda: op(Float(a), b), lambda: _scalar_op(wrap(a), wrap(b), fn))
+                check_same(lambda: op(b, Float(a)), lambda: _scalar_op(wrap(b), wrap(a), fn))
+            for op, fn in [(operator.gt, _single_gt), (operator.ge, _single_ge), (operator.lt, _single_lt), (operator.le, _single_le), (operator.eq, lambda x, y: float(x) == float(y))]:
+                assert op(Float(a), b) is fn(wrap(a), wrap(b)) and op(b, Float(a)) is fn(wrap(b), wrap(a))
+
+    for x in [va, ma, mb, wrap([ma, [1, 2], 'x']), wrap([[1, 'a'], [2, 3, 4], 5])]:
+        for f in [lambda: x.flat, lambda: x.T, lambda: x.shape, lambda: x.reshaped([7, 40]), lambda: x.reshaped([3, 2, 11]), lambda: x.reshaped(5), lambda: x.reshaped([])]:
+            check_fast(f)
+        assert inspect.isgenerator(x.xflat) and same(wrap(list(x.xflat)), x.flat) and inspect.isgenerator(x.xT) and same(wrap(list(x.xT)), slow(lambda: x.T))
+        buf, res = io.StringIO(), outcome(lambda: x.csv)
+        assert outcome(lambda: x.write_csv(buf))[0] == res[0] and (not res[0] or buf.getvalue() == res[1])
+    with tempfile.TemporaryDirectory() as d:
+        ma.write_csv(f'{d}/ma.csv')
+        with open(f'{d}/ma.csv', newline = '') as f: assert f.read() == ma.csv
+
+    v = wrap(list(range(100)))
+    assert type(v) is _CompactList and is_wrapped(v) and all(type(x) is Float for x in v) and v == list(range(100)) and list(reversed(v)) == list(range(99, -1, -1))
+    assert v[5] == 5 and type(v[5]) is Float and v['6'] == 6 and v[100] == '' and type(v[2:5]) is _CompactList and v[2:5] == [2, 3, 4] and v[wrap([1, 3])] == [1, 3]
+    assert 42 in v and '42' in v and 100 not in v and [1] not in v and v.index(42) == 42 and v.index(-3) == -1 and v.last == 99
+    boxed = List(map(Float, [*range(300), 2.5, *range(300)])) # large enough to be indexed after the first search
+    compact = wrap([*range(300), 2.5, *range(300)])
+    assert type(boxed) is List and type(compact) is _CompactList
+    for value in [5, 2.5, '5', '2.50', 'abc', '', 'nan', math.nan, 2 ** 2000, 299, 300, [5], None, True, False, 0, 1, '0', '1']:
+        assert (value in boxed) == (value in compact), value
+        for args in [(), (3,), (10,), (310,), (-3,), (-300,), (-2000,), (2000,), (3, 5), (3, 6), (10, -20), (-320, -290), (550, 0), (0, 2000), (301, 320)]:
+            assert boxed.index(value, *args) == compact.index(value, *args) and type(compact.index(value, *args)) is Float, (value, args)
+    for items in [['a'] * 300 + [False], ['a'] * 300 + [True, '0', 1], ['a'] * 300 + ['1', 0, '0']]: # the first search is linear, later ones use the index
+        mixed = wrap(items)
+        for value in [False, True, 0, 1, '0', '1', 'A', 2]:
+            assert len({ (float(mixed.index(value)), value in mixed) for _ in range(3) }) == 1, (items[300:], value)
+    v[0], v[-1], v['x'] = 7, 'neg', 'key'
+    assert type(v) is _CompactList and v[0] == 7 and v[-1] == 'neg' and v['x'] == 'key' and len(v) == 100
+    v.append(100); v.insert(0, -1); v.extend([101, 102.5]); del v[1]; del v[-1]
+    assert type(v) is _CompactList and len(v) == 103 and v[0] == -1 and v[1] == 1 and v.last == 102.5 and v.pop() == 102.5 and len(v) == 102
+    assert v == copy.deepcopy(v) and type(copy.deepcopy(v)) is _CompactList and v == pickle.loads(pickle.dumps(v)) and np.array_equal(np.asarray(v), [-1, *range(1, 102)])
+    assert repr(wrap(list(range(64)))) == repr(list(map(float, range(64)))) and sys.getsizeof(wrap(list(range(1000)))) < sys.getsizeof(List(map(Float, range(1000))))
+    v.append('hello')
+    assert type(v) is List and len(v) == 103 and v.last == 'hello' and v[5] == 5 and all(is_wrapped(x) for x in list.__iter__(v))
+    v = wrap(list(range(100))); v.insert(3, [1, 2])
+    assert type(v) is List and v[3] == [1, 2] and v[4] == 3 and len(v) == 101
+    v = wrap(list(range(100))); v.extend([2 ** 2000])
+    assert type(v) is List and len(v) == 101
+    v = wrap([*range(100), 2 ** 2000])
+    assert type(v) is List and len(v) == 101
+    v = wrap(list(range(100))); v.sort(key = lambda x: -x)
+    assert type(v) is List and v[0] == 99 and is_wrapped(v[0])
+    assert outcome(lambda: sqrt(wrap([*range(100), -1])))[1] is ValueError and outcome(lambda: sqrt(wrap([*range(100), 4])))[0]
+
     print('passed all snap wrapper tests')
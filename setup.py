@@ -1,4 +1,4 @@
-from setuptools import setup
+from setuptools import setup, find_packages
 
 import meta
 
@@ -12,7 +12,7 @@ setup(
     author = meta.author,
     author_email = meta.author_email,
     license = 'Apache 2.0',
-    packages = [ 'netsblox' ],
+    packages = find_packages(include = [ 'netsblox', 'netsblox.*' ]), # generated clients are packages with a module per service
     include_package_data = True,
     install_requires = [
         'websocket-client',
@@ -28,6 +28,9 @@ setup(
         'parso',
         'jedi',
     ],
+    extras_require = {
+        'server': [ 'aiohttp' ], # only needed for netsblox.server.LocalServer
+    },
     classifiers = [
         'Development Status :: 1 - Planning',
         'License :: OSI Approved :: Apache Software License',
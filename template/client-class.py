@@ -1,9 +1,12 @@
 import collections as _collections
 import threading as _threading
+import functools as _functools
+import importlib as _importlib
 import traceback as _traceback
+import atexit as _atexit
 import inspect as _inspect
-import copy as _copy
 import json as _json
+import weakref as _weakref
 import time as _time
 import sys as _sys
 import io as _io
@@ -13,7 +16,7 @@ from deprecation import deprecated
 
 from PIL import Image
 
-from typing import Optional, Any, List, Union
+from typing import Optional, Any, List, Union, Dict, Tuple, TYPE_CHECKING
 
 import websocket as _websocket
 import requests as _requests
@@ -34,7 +37,16 @@ class $client_name:
     Holds all the information and plumbing required to connect to netsblox, exchange messages, and call RPCs.
     '''
 
-    def __init__(self, *, project_name: Optional[str] = None, project_id: Optional[str] = None, run_forever: bool = False):
+    RECONNECT_DELAY_MIN = 0.5 # seconds - doubles after each failed attempt
+    RECONNECT_DELAY_MAX = 30 # seconds
+    FLUSH_TIMEOUT = 10 # seconds - max time spent sending queued messages on disconnect/exit
+    SEND_QUEUE_TIMEOUT = 30 # seconds - max time send_message() waits for space in a full send queue before dropping the message
+    FEATURES_MSG_TYPE = '_pyblox_features' # internal message type used to tell other pyblox clients what we can decode
+    FEATURES = ['raw-images']
+
+    def __init__(self, *, project_name: Optional[str] = None, project_id: Optional[str] = None, run_forever: bool = False,
+        send_queue_limit: int = 1024, send_batch_window: float = 0, reconnect: bool = True, base_url: Optional[str] = None,
+        background_connect: bool = False):
         '''
         Opens a new client connection to NetsBlox, allowing you to access any of the NetsBlox services from python.
 
@@ -47,16 +59,39 @@ class $client_name:
         This is useful if you have long-running programs that are based on message-passing rather than looping.
         Note: this does not stop the main thread of execution from terminating, which could be a problem in environments like Google Colab;
         instead, you can explicitly call `wait_till_disconnect()` at the end of your program.
+
+        Outgoing messages are queued and sent in the background so that `send_message()` does not block on the network.
+        `send_queue_limit` is the maximum number of queued messages before `send_message()` waits for the queue to drain.
+        If there is still no space after `SEND_QUEUE_TIMEOUT` seconds (e.g., while reconnecting), the message is dropped and counted in `send_stats`.
+        `send_batch_window` is an extra delay (in seconds) to wait for more messages before sending a batch;
+        the default of zero only batches messages that are already waiting in the queue.
+
+        `reconnect` controls whether the client automatically reconnects (with exponential backoff) if the connection to NetsBlox is lost.
+        Outgoing messages are kept in the queue while reconnecting and sent once the connection is restored.
+        You can use `on_connection_state` to be notified of connection changes.
+
+        `base_url` is the address of the NetsBlox server to connect to (defaults to `$base_url`).
+        For instance, this can be the `base_url` of a `netsblox.server.LocalServer` for offline testing.
+
+        `background_connect` makes the constructor return immediately and register with NetsBlox in the background.
+        RPC calls wait until this is done, and sent messages are queued until then, so this is mostly transparent.
+        You can use `wait_till_ready()` to wait for it explicitly.
         '''
 
-        self._base_url = '$base_url'
+        self._base_url = (base_url or '$base_url').rstrip('/')
         self._client_id = project_id or _common.generate_project_id()
         self._project_name = project_name or 'untitled'
 
-        res = _json.loads(_requests.get(f'{self._base_url}/configuration').text)
-        self._services_url = res['servicesHosts'][0]['url']
+        self._ready = _threading.Event() # set once the handshake with the server is done (even if it failed)
+        self._connect_error = None
 
         self._room_handle = None
+        self._route_cache = (None, {}) # ((room membership version, raw image peer count), maps target spec to resolved (pyblox addrs, other addrs, local count))
+
+        # older pyblox clients can't decode raw image attachments, so they're only sent to clients that told us they can.
+        # these are only ever added to (by the websocket thread), so other threads can check them without locking
+        self._raw_image_peers = set()
+        self._features_sent = set() # pyblox clients we've told about our features
 
         # set these up before the websocket since it might send us messages
         self._message_cv = _threading.Condition(_threading.Lock())
@@ -64,6 +99,25 @@ class $client_name:
         self._message_handlers = {}
         self._message_last = {} # maps msg type to {received_count, last_content, waiters (count)}
         self._message_stream_stopped = False
+        self._message_limits = {} # maps msg type to (limit, overflow policy) - unbounded if absent
+        self._message_counts = {} # maps msg type to number of queued messages
+        self._message_dropped = {} # maps msg type to number of dropped messages
+
+        # outgoing messages are sent by a writer thread so senders don't block on the websocket
+        self._send_cv = _threading.Condition(_threading.Lock())
+        self._send_queue = _collections.deque()
+        self._send_queue_limit = max(send_queue_limit, 1)
+        self._send_batch_window = send_batch_window
+        self._send_pending = 0 # queued or currently being sent
+        self._send_stats = { 'messages': 0, 'frames': 0, 'dropped': 0, 'first_send': None, 'last_send': None }
+        self._send_stream_stopped = False
+
+        self._ws_state = 'connecting'
+        self._ws_state_handlers = []
+        self._ws_closing = _threading.Event()
+        self._ws_retry_delay = $client_name.RECONNECT_DELAY_MIN
+        self._ws_was_connected = False
+        self._reconnect = reconnect
 
         # create a websocket and start it before anything non-essential (has some warmup communication)
         self._ws_lock = _threading.Lock()
@@ -74,7 +128,17 @@ class $client_name:
                 'cert_reqs': ssl.CERT_OPTIONAL,
                 'ca_certs': certifi.where(),
             }
-            self._ws.run_forever(sslopt = opt)
+            while True:
+                self._ws.run_forever(sslopt = opt)
+                if self._ws_closing.is_set() or not self._reconnect:
+                    break
+
+                self._set_connection_state('reconnecting')
+                self._ws_closing.wait(self._ws_retry_delay)
+                self._ws_retry_delay = min(self._ws_retry_delay * 2, $client_name.RECONNECT_DELAY_MAX)
+                if self._ws_closing.is_set():
+                    break
+            self._set_connection_state('disconnected')
         self._ws_thread = _threading.Thread(target = run_ws)
         self._ws_thread.setDaemon(not run_forever)
         self._ws_thread.start()
@@ -84,32 +148,132 @@ class $client_name:
         self._message_thread.setDaemon(True)
         self._message_thread.start()
 
-        res = _json.loads(_requests.post(f'{self._base_url}/projects/',
-            _common.small_json({ 'clientId': self._client_id, 'name': self._project_name }),
-            headers = { 'Content-Type': 'application/json' }).text)
-        self._project_id = res['id']
-        role = next(iter(res['roles'].items()))
-        self._role_id = role[0]
-        self._role_name = role[1]['name']
+        # create a thread to send queued messages - flush at exit so short scripts don't lose their last messages
+        self._send_thread = _threading.Thread(target = self._send_writer)
+        self._send_thread.setDaemon(True)
+        self._send_thread.start()
+        # only a weak reference, so the exit hook doesn't keep every client that was ever created alive
+        self_ref = _weakref.ref(self)
+        def flush_at_exit():
+            client = self_ref()
+            if client is not None: client.flush($client_name.FLUSH_TIMEOUT)
+        self._flush_at_exit = flush_at_exit
+        _atexit.register(flush_at_exit)
+
+        if background_connect:
+            _threading.Thread(target = self._handshake, kwargs = { 'background': True }, daemon = True).start()
+        else:
+            self._handshake()
+
+$service_instances
+
+    def _handshake(self, background: bool = False):
+        try:
+            # the configuration is independent of registering the project, so fetch it concurrently
+            config_error = []
+            def get_config():
+                try:
+                    res = _json.loads(_requests.get(f'{self._base_url}/configuration').text)
+                    self._services_url = res['servicesHosts'][0]['url']
+                except Exception as e:
+                    config_error.append(e)
+            config_thread = _threading.Thread(target = get_config, daemon = True)
+            config_thread.start()
+
+            res = _json.loads(_requests.post(f'{self._base_url}/projects/',
+                _common.small_json({ 'clientId': self._client_id, 'name': self._project_name }),
+                headers = { 'Content-Type': 'application/json' }).text)
+            self._project_id = res['id']
+            role = next(iter(res['roles'].items()))
+            self._role_id = role[0]
+            self._role_name = role[1]['name']
+
+            self._post_network_state()
+
+            config_thread.join()
+            if config_error:
+                raise config_error[0]
+        except Exception as e:
+            self._connect_error = e
+            if not background: raise # otherwise wait_till_ready() (or the first RPC) reports it
+        finally:
+            self._ready.set()
+
+    def wait_till_ready(self, timeout: Optional[float] = None) -> bool:
+        '''
+        Waits until the client has registered with NetsBlox, which is only needed if it was created with `background_connect`.
+        Returns `True` on success, or `False` if the timeout (in seconds) expired first.
+        Raises an exception if registering failed.
+        '''
+        if not self._ready.wait(timeout):
+            return False
+        if self._connect_error is not None:
+            raise RuntimeError(f'Failed to connect to NetsBlox: {self._connect_error}')
+        return True
 
+    def _post_network_state(self):
         _requests.post(f'{self._base_url}/network/{self._client_id}/state',
             _common.small_json({ 'state': { 'external': { 'address': self._project_name, 'appId': 'py' } } }),
             headers = { 'Content-Type': 'application/json' })
 
-$service_instances
-
     def _ws_open(self, ws):
         with self._ws_lock:
             ws.send(_common.small_json({ 'type': 'set-uuid', 'clientId': self._client_id }))
 
+        if self._ws_was_connected:
+            # the server may have restarted and forgotten about us, so re-register our public address
+            _threading.Thread(target = self._post_network_state, daemon = True).start()
+        self._ws_was_connected = True
+        self._ws_retry_delay = $client_name.RECONNECT_DELAY_MIN
+        self._set_connection_state('connected')
+
     def _ws_close(self, ws, status, message):
         print('ws close', file = _sys.stderr)
     def _ws_error(self, ws, error):
         print('ws error:', error, file = _sys.stderr)
 
+    def _set_connection_state(self, state):
+        with self._send_cv:
+            if self._ws_state == state: return
+            self._ws_state = state
+            self._send_cv.notify_all() # the writer only sends while connected
+            handlers = self._ws_state_handlers[:]
+        for handler in handlers:
+            handler.schedule(state)
+
+    @property
+    def connection_state(self) -> str:
+        '''
+        Gets the current state of the connection to NetsBlox: `'connecting'`, `'connected'`, `'reconnecting'`, or `'disconnected'`.
+        '''
+        with self._send_cv:
+            return self._ws_state
+
+    def on_connection_state(self, f):
+        '''
+        This is a decorator that can be applied to a function to cause it to be called with the new connection state
+        (see `connection_state`) whenever the connection to NetsBlox changes.
+
+        ```
+        @nb.on_connection_state
+        def on_state(state):
+            print('connection is now', state)
+        ```
+        '''
+        with self._send_cv:
+            self._ws_state_handlers.append(_events.get_event_wrapper(f))
+        return f
+    def remove_connection_state_handler(self, f) -> None:
+        '''
+        Stops calling `f` (which was registered with `on_connection_state`) when the connection to NetsBlox changes.
+        '''
+        with self._send_cv:
+            self._ws_state_handlers = [x for x in self._ws_state_handlers if x.wrapped() is not f]
+
     def _ws_message(self, ws, message):
         try:
-            message = _json.loads(message)
+            has_attachments = _common.IMAGE_ATTACHMENT_KEY in message # a quick check so normal messages don't need to be scanned
+            message = _common.parse_json(message)
             ty = message['type']
 
             if ty == 'connected': # currently unused
@@ -119,12 +283,33 @@ $service_instances
                     ws.send(_common.small_json({ 'type': 'pong' }))
                     return
             elif ty == 'message':
+                src = message.get('srcId')
+                if isinstance(src, str) and src.endswith('#py') and src not in self._features_sent:
+                    self._features_sent.add(src)
+                    self._send_features(src)
+                if message.get('msgType') == $client_name.FEATURES_MSG_TYPE:
+                    if 'raw-images' in message.get('content', {}).get('features', ()): self._raw_image_peers.add(src)
+                    return
+
+                message['attachments'] = has_attachments # decoded by the router, since this thread also needs to answer pings
                 with self._message_cv:
-                    self._message_queue.append(message)
+                    self._message_enqueue_assume_locked(message, can_block = False) # this thread also needs to answer pings
                     self._message_cv.notify()
         except:
             pass
 
+    def _send_features(self, dst: str) -> None:
+        # this is only sent once per peer, so it skips the queue limit (which we can't wait for on the websocket thread)
+        with self._send_cv:
+            self._send_queue.append({
+                'msgType': $client_name.FEATURES_MSG_TYPE,
+                'content': _common.small_json({ 'features': $client_name.FEATURES }),
+                'dstId': [dst],
+                'srcId': self.public_id,
+            })
+            self._send_pending += 1
+            self._send_cv.notify_all()
+
     def set_room(self, room: Optional[_rooms.RuntimeRoomManager]) -> None:
         '''
         Sets the room that this client should be part of.
@@ -133,6 +318,7 @@ $service_instances
         '''
         assert self._room_handle is None
         self._room_handle = room
+        self._route_cache = (None, {})
 
     @property
     def public_id(self) -> str:
@@ -155,67 +341,253 @@ $service_instances
         ```
         nb.send_message('message', 'local', msg = 'hello world')
         ```
+
+        Values are copied when the message is sent, so you can safely modify them afterwards.
+        All local recipients (and their message handlers) share the same received values, so handlers should not modify them in place.
+        Images are sent as Snap costumes, except to PyBlox clients (including yourself) which have told us that they can receive them as images
+        (which happens automatically once they've received a message from you).
         '''
-        values = { k: _common.prep_send(v) for k, v in values.items() }
-        targets = [target] if isinstance(target, str) else target
         my_addr = self.public_id
-
-        role_info = []
-        def get_roles():
-            if len(role_info) != 0: return role_info[0]
-            role_info.append({} if self._room_handle is None else self._room_handle.get_roles())
-            return role_info[0]
-
-        extern_targets = []
-        local_count = 0
-        for target in targets:
-            if '@' in target:
-                extern_targets.append(target)
-            elif target == 'local':
-                local_count += 1
-            elif target == 'everyone in room' or target == 'others in room':
-                for addrs in get_roles().values():
-                    for addr in addrs:
-                        if addr != my_addr: extern_targets.append(addr)
-                if target == 'everyone in room':
-                    local_count += 1
-            else:
-                for addr in get_roles().get(target, []):
-                    if addr != my_addr: extern_targets.append(addr)
-                    else: local_count += 1
+        if isinstance(target, str):
+            pyblox_targets, other_targets, local_count = self._resolve_target(target)
+        else:
+            pyblox_targets, other_targets, local_count = [], [], 0
+            for x in target:
+                pyblox_addrs, other_addrs, count = self._resolve_target(x)
+                pyblox_targets.extend(pyblox_addrs)
+                other_targets.extend(other_addrs)
+                local_count += count
 
         if local_count > 0:
-            copies = [_copy.deepcopy(values) for _ in range(local_count)]
+            # local recipients share one private copy, since they are handled asynchronously
+            content = { k: _common.prep_send(v, detach = True, keep_images = True) for k, v in values.items() }
             with self._message_cv:
-                for copy in copies:
-                    self._message_queue.append({
+                for _ in range(local_count):
+                    self._message_enqueue_assume_locked({
                         'msgType': msg_type,
-                        'content': copy,
+                        'content': content,
                     })
                 self._message_cv.notify()
-        if len(extern_targets) > 0:
-            with self._ws_lock:
-                self._ws.send(_common.small_json({
-                    'type': 'message',
+        # pyblox clients that told us they can decode raw image attachments get those, which are much cheaper than the snap-compatible costumes
+        for extern_targets, images in ((pyblox_targets, 'raw'), (other_targets, 'costume')):
+            if len(extern_targets) == 0: continue
+            content = _common.small_json({ k: _common.prep_send(v, keep_images = True) for k, v in values.items() }, images = images) # serializing is also our private copy
+            with self._send_cv:
+                deadline = _time.time() + $client_name.SEND_QUEUE_TIMEOUT
+                full = False
+                while len(self._send_queue) >= self._send_queue_limit and not self._send_stream_stopped:
+                    remaining = deadline - _time.time()
+                    if remaining <= 0:
+                        full = True # e.g., because we've been reconnecting for a while
+                        break
+                    self._send_cv.wait(remaining) # backpressure - wait for the writer to catch up
+                if full:
+                    self._send_stats['dropped'] += 1
+                    continue
+                self._send_queue.append({
                     'msgType': msg_type,
-                    'content': values,
+                    'content': content,
                     'dstId': extern_targets,
                     'srcId': my_addr,
-                }))
+                })
+                self._send_pending += 1
+                self._send_cv.notify_all()
+
+    def _resolve_target(self, target: str) -> Tuple[Tuple[str, ...], Tuple[str, ...], int]:
+        # returns the (extern pyblox addresses, other extern addresses, local recipient count) for a single target
+        if '@' in target: return ((target,), (), 0) if target in self._raw_image_peers else ((), (target,), 0)
+        if target == 'local': return (), (), 1
+
+        # room targets are cached until the room membership (or a peer's features) changes, so repeated sends are just a dict lookup
+        room = self._room_handle
+        version = (None if room is None else room.membership_version, len(self._raw_image_peers)) # read before the roles, so a concurrent change just invalidates us
+        cache_version, cache = self._route_cache
+        if cache_version != version:
+            cache = {}
+            self._route_cache = (version, cache)
+        res = cache.get(target)
+        if res is not None: return res
+
+        roles = {} if room is None else room.get_roles()
+        my_addr = self.public_id
+        extern_targets = []
+        local_count = 0
+        if target == 'everyone in room' or target == 'others in room':
+            for addrs in roles.values():
+                for addr in addrs:
+                    if addr != my_addr: extern_targets.append(addr)
+            if target == 'everyone in room':
+                local_count += 1
+        else:
+            for addr in roles.get(target, []):
+                if addr != my_addr: extern_targets.append(addr)
+                else: local_count += 1
+
+        raw_peers = self._raw_image_peers
+        res = (tuple(x for x in extern_targets if x in raw_peers), tuple(x for x in extern_targets if x not in raw_peers), local_count)
+        cache[target] = res
+        return res
+
+    @staticmethod
+    def _batch_frames(messages) -> list:
+        # the server only accepts one message per frame, but consecutive messages with identical content can share a frame
+        # returns a list of (frame, message count) pairs
+        frames = [] # [msg type, content json, src id, dst ids, message count]
+        for message in messages:
+            content = message['content'] # already serialized by send_message()
+            prev = frames[-1] if frames else None
+            if prev is not None and prev[:3] == [message['msgType'], content, message['srcId']] and not any(x in prev[3] for x in message['dstId']):
+                prev[3].extend(message['dstId'])
+                prev[4] += 1
+            else:
+                frames.append([message['msgType'], content, message['srcId'], list(message['dstId']), 1])
+
+        res = []
+        for msg_type, content, src, dsts, count in frames:
+            frame = f'{{"type":"message","msgType":{_common.small_json(msg_type)},"content":{content},"dstId":{_common.small_json(dsts)},"srcId":{_common.small_json(src)}}}'
+            res.append((frame, count))
+        return res
+    def _send_writer(self):
+        self._ready.wait() # the server doesn't know our address until the handshake is done
+        while True:
+            try:
+                with self._send_cv:
+                    while (not self._send_queue or self._ws_state in ('connecting', 'reconnecting')) and not self._send_stream_stopped:
+                        self._send_cv.wait()
+                    if self._send_stream_stopped and (not self._send_queue or self._ws_state != 'connected'):
+                        self._send_pending -= len(self._send_queue) # anything left over is dropped
+                        self._send_queue.clear()
+                        self._send_cv.notify_all()
+                        return
+                if self._send_batch_window > 0:
+                    _time.sleep(self._send_batch_window) # give other messages a chance to join this batch
+                with self._send_cv:
+                    batch = list(self._send_queue)
+                    self._send_queue.clear()
+                    self._send_cv.notify_all() # wake up any senders waiting on a full queue
+
+                done_messages, sent_messages, sent_frames = 0, 0, 0
+                try:
+                    frames = $client_name._batch_frames(batch)
+                    with self._ws_lock:
+                        for frame, count in frames:
+                            self._ws.send(frame)
+                            sent_messages += count
+                            sent_frames += 1
+                            done_messages += count
+                except:
+                    if not self._reconnect:
+                        _traceback.print_exc(file = _sys.stderr)
+
+                lost_connection = False
+                with self._send_cv:
+                    unsent = batch[done_messages:]
+                    if unsent and self._reconnect and not self._send_stream_stopped:
+                        self._send_queue.extendleft(reversed(unsent)) # keep them for after we reconnect
+                        lost_connection = True
+                    else:
+                        done_messages = len(batch)
+
+                    stats = self._send_stats
+                    stats['last_send'] = _time.time()
+                    if stats['first_send'] is None:
+                        stats['first_send'] = stats['last_send']
+                    stats['messages'] += sent_messages
+                    stats['frames'] += sent_frames
+                    self._send_pending -= done_messages
+                    self._send_cv.notify_all() # wake up anyone waiting for a flush
+
+                if lost_connection:
+                    self._set_connection_state('reconnecting')
+                    self._ws.close() # make sure the websocket thread notices and starts reconnecting
+            except:
+                _traceback.print_exc(file = _sys.stderr)
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        '''
+        Waits until all queued outgoing messages have been sent (or until `timeout` seconds have passed, if provided).
+        Returns `True` if everything was sent, otherwise `False`.
+        '''
+        deadline = None if timeout is None else _time.time() + timeout
+        with self._send_cv:
+            while self._send_pending > 0:
+                remaining = None if deadline is None else deadline - _time.time()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._send_cv.wait(remaining)
+            return True
+
+    @property
+    def send_stats(self) -> dict:
+        '''
+        Gets statistics about outgoing messages: the current queue depth, the number of messages and frames sent,
+        the number of messages dropped because the send queue stayed full (see `SEND_QUEUE_TIMEOUT`),
+        and the average send throughput (messages per second) between the first and most recent sends.
+        '''
+        with self._send_cv:
+            stats = self._send_stats
+            elapsed = stats['last_send'] - stats['first_send'] if stats['first_send'] is not None else 0
+            return {
+                'queue_depth': len(self._send_queue),
+                'messages_sent': stats['messages'],
+                'frames_sent': stats['frames'],
+                'messages_dropped': stats['dropped'],
+                'messages_per_second': stats['messages'] / elapsed if elapsed > 0 else 0.0,
+            }
 
     @staticmethod
-    def _check_handler(handler, content):
+    def _compile_handler(handler):
+        # inspect the handler once (on registration) and return a function that selects its inputs from message content
         argspec = _inspect.getfullargspec(handler.wrapped())
-        unused_params = set(content.keys())
-        for arg in argspec.args + argspec.kwonlyargs:
-            if arg not in content and arg != 'self':
-                return f'    unknown param: \'{arg}\' typo?\n    available params: {list(content.keys())}'
-            unused_params.discard(arg)
-        return { k: content[k] for k in content.keys() if k not in unused_params } if unused_params and argspec.varkw is None else content
+        params = tuple(x for x in argspec.args + argspec.kwonlyargs if x != 'self')
+        takes_all = argspec.varkw is not None
+        def select(content):
+            for param in params:
+                if param not in content:
+                    return f'    unknown param: \'{param}\' typo?\n    available params: {list(content.keys())}'
+            if takes_all or len(content) == len(params):
+                return content
+            return { k: content[k] for k in params }
+        return select
+    def _message_enqueue_assume_locked(self, message, can_block: bool = True):
+        msg_type = message['msgType']
+        count = self._message_counts.get(msg_type, 0)
+        limit = self._message_limits.get(msg_type)
+        if limit is not None and count >= limit[0]:
+            if limit[1] == 'block':
+                if can_block: # received messages can't be held back without stalling the connection, so those just go over the limit
+                    self._message_cv.notify_all() # the router might not know about messages we (or send_message) just queued
+                    while msg_type in self._message_limits and self._message_counts.get(msg_type, 0) >= self._message_limits[msg_type][0] and not self._message_stream_stopped:
+                        self._message_cv.wait()
+                    count = self._message_counts.get(msg_type, 0)
+            elif limit[1] == 'drop-newest':
+                self._message_dropped[msg_type] = self._message_dropped.get(msg_type, 0) + 1
+                return
+            elif limit[1] == 'drop-oldest':
+                for i, queued in enumerate(self._message_queue):
+                    if queued['msgType'] == msg_type:
+                        del self._message_queue[i]
+                        break
+                self._message_dropped[msg_type] = self._message_dropped.get(msg_type, 0) + 1
+                count -= 1
+            else:
+                self._message_queue = _collections.deque(x for x in self._message_queue if x['msgType'] != msg_type)
+                self._message_dropped[msg_type] = self._message_dropped.get(msg_type, 0) + count
+                count = 0
+
+        self._message_queue.append(message)
+        self._message_counts[msg_type] = count + 1
     def _message_get_last_assume_locked(self, msg_type):
         if msg_type not in self._message_last:
             self._message_last[msg_type] = { 'received_count': 0, 'last_content': {}, 'waiters': 0 }
         return self._message_last[msg_type]
+    def _message_received_assume_locked(self, message):
+        last = self._message_get_last_assume_locked(message['msgType'])
+        last['received_count'] += 1
+        last['last_content'] = message['content']
+        if last['waiters'] > 0:
+            last['waiters'] = 0
+            self._message_cv.notify_all()
     def _message_router(self):
         while True:
             try:
@@ -233,25 +605,33 @@ $service_instances
                         return
 
                     message = self._message_queue.popleft()
-                    handlers = self._message_handlers.get(message['msgType'])
-                    handlers = handlers[:] if handlers is not None else [] # iteration without mutex needs a (shallow) copy
+                    handlers = self._message_handlers.get(message['msgType'], ()) # immutable, so safe to use without the mutex
+
+                    self._message_counts[message['msgType']] -= 1
+                    if message['msgType'] in self._message_limits:
+                        self._message_cv.notify_all() # wake senders blocked on a full queue
 
-                    last = self._message_get_last_assume_locked(message['msgType'])
-                    last['received_count'] += 1
-                    last['last_content'] = message['content']
-                    if last['waiters'] > 0:
-                        last['waiters'] = 0
-                        self._message_cv.notify_all()
+                    attachments = message.get('attachments', False)
+                    if not attachments:
+                        self._message_received_assume_locked(message)
+
+                if attachments: # decoding can take a while, so do it without the mutex lock
+                    message['content'] = _common.decode_attachments(message['content'])
+                    with self._message_cv:
+                        self._message_received_assume_locked(message)
 
                 content = message['content']
-                for handler in handlers: # without mutex lock so we don't block new ws messages or on_message()
+                for handler, select in handlers: # without mutex lock so we don't block new ws messages or on_message()
                     try:
-                        packet = $client_name._check_handler(handler, content)
-                        if type(packet) == str:
+                        packet = select(content)
+                        if type(packet) is str:
                             print(f'\'{message["msgType"]}\' message handler error:\n{packet}', file = _sys.stderr)
                             continue
 
-                        handler.schedule(**packet)
+                        dropped = handler.schedule(**packet)
+                        if dropped:
+                            with self._message_cv:
+                                self._message_dropped[message['msgType']] = self._message_dropped.get(message['msgType'], 0) + dropped
                     except:
                         _traceback.print_exc(file = _sys.stderr)
             except:
@@ -272,14 +652,58 @@ $service_instances
                 self._message_cv.wait()
             return last['last_content']
 
-    def _on_message(self, msg_type: str, handler):
+    def set_message_queue_limit(self, msg_type: str, limit: Optional[int], overflow: _events.OverflowPolicy = 'drop-oldest') -> None:
+        '''
+        Bounds the number of received messages of the given type which are waiting to be handled, or removes the bound if `limit` is `None`.
+        This keeps a flood of messages from growing memory without limit if they arrive faster than they can be handled.
+
+        `overflow` controls what happens when a message arrives while the queue is full:
+        `'drop-oldest'` discards the oldest waiting message, `'drop-newest'` discards the new message,
+        `'coalesce-latest'` discards all waiting messages so that only the newest is kept,
+        and `'block'` makes `send_message()` to yourself wait for space (messages from other clients are still queued,
+        since holding them back would also stall the connection).
+
+        To bound the calls waiting for an individual message handler, see the `queue_limit` option of `on_message()`.
+        Dropped messages are counted by `dropped_messages`.
+
+        ```
+        nb.set_message_queue_limit('sensor reading', 16, 'coalesce-latest')
+        ```
+        '''
+        _events.check_overflow_policy(overflow)
         with self._message_cv:
-            handlers = self._message_handlers.get(msg_type)
-            if handlers is None:
-                handlers = []
-                self._message_handlers[msg_type] = handlers
-            handlers.append(_events.get_event_wrapper(handler))
-    def on_message(self, *msg_types: str):
+            if limit is None:
+                self._message_limits.pop(msg_type, None)
+            else:
+                self._message_limits[msg_type] = (max(limit, 1), overflow)
+            self._message_cv.notify_all()
+
+    @property
+    def dropped_messages(self) -> Dict[str, int]:
+        '''
+        Gets the number of received messages of each type which were dropped due to a queue limit
+        (see `set_message_queue_limit()` and the `queue_limit` option of `on_message()`).
+        '''
+        with self._message_cv:
+            return dict(self._message_dropped)
+
+    def _on_message(self, msg_type: str, handler, queue_limit: Optional[int] = None, overflow: _events.OverflowPolicy = 'drop-oldest'):
+        wrapper = _events.get_event_wrapper(handler)
+        if queue_limit is not None:
+            wrapper.set_queue_limit(queue_limit, overflow)
+        entry = (wrapper, $client_name._compile_handler(wrapper))
+        with self._message_cv:
+            # replace rather than mutate so the message router can iterate without copying or locking
+            self._message_handlers[msg_type] = (*self._message_handlers.get(msg_type, ()), entry)
+    def remove_message_handler(self, msg_type: str, f) -> None:
+        '''
+        Stops calling `f` (which was registered with `on_message()`) when a message of the given type is received.
+        '''
+        with self._message_cv:
+            handlers = tuple(x for x in self._message_handlers.get(msg_type, ()) if x[0].wrapped() is not f)
+            if handlers: self._message_handlers[msg_type] = handlers
+            else: self._message_handlers.pop(msg_type, None)
+    def on_message(self, *msg_types: str, queue_limit: Optional[int] = None, overflow: _events.OverflowPolicy = 'drop-oldest'):
         '''
         This is a decorator that can be applied to a sprite/stage method or a function
         to cause the function to be executed when a message of the given type is received from NetsBlox.
@@ -294,18 +718,29 @@ $service_instances
         def on_left_or_right(self, distance):
             print('moved', distance, 'cm')
         ```
+
+        By default, messages wait for the handler without limit.
+        `queue_limit` bounds the number of messages waiting for this handler, and `overflow` controls what happens when it is full
+        (see `set_message_queue_limit()` for the options).
+
+        ```
+        @nb.on_message('sensor reading', queue_limit = 1, overflow = 'coalesce-latest')
+        def on_reading(value):
+            print('latest value', value)
+        ```
         '''
+        _events.check_overflow_policy(overflow)
         def wrapper(f):
             if _common.is_method(f):
                 if not hasattr(f, '__run_on_message'):
                     setattr(f, '__run_on_message', [])
                 # mark it for the constructor to handle when an instance is created
                 def stupid_closure_semantics(_msg_type):
-                    return lambda x: self._on_message(_msg_type, x)
+                    return lambda x: self._on_message(_msg_type, x, queue_limit, overflow)
                 getattr(f, '__run_on_message').extend([stupid_closure_semantics(msg_type) for msg_type in msg_types])
             else:
                 for msg_type in msg_types:
-                    self._on_message(msg_type, f)
+                    self._on_message(msg_type, f, queue_limit, overflow)
 
             return f
         return wrapper
@@ -334,6 +769,7 @@ $service_instances
         ```
         '''
         arguments = { k: _common.prep_send(v) for k, v in kwargs.items() }
+        self.wait_till_ready()
 
         time = round(_time.time() * 1000)
         url = f'{self._services_url}/{service}/{rpc}?clientId={self._client_id}&t={time}'
@@ -350,7 +786,7 @@ $service_instances
                 m = _SNAP_IMAGE_REGEX.match(res.text)
                 if m is not None:
                     return _common.decode_image(m[1]).convert('RGBA')
-                return _json.loads(res.text)
+                return _common.parse_json(res.text)
             except:
                 return res.text # strings are returned unquoted, so they'll fail to parse as json
         else:
@@ -360,7 +796,14 @@ $service_instances
         '''
         Disconnects the client from the NetsBlox server.
         If the client was created with run_forever, this will allow the program to terminate.
+        Any messages that are still queued will be sent first.
         '''
+        self.flush($client_name.FLUSH_TIMEOUT)
+        _atexit.unregister(self._flush_at_exit)
+        with self._send_cv:
+            self._send_stream_stopped = True
+            self._send_cv.notify_all()
+        self._ws_closing.set() # stop reconnecting
         with self._ws_lock:
             self._ws.close() # closing the websocket will kill the ws thread
         with self._message_cv:
@@ -382,4 +825,18 @@ $service_instances
         '''
         self._message_thread.join()
 
-$service_classes
+$service_imports
+
+_SERVICE_MODULES = { # maps service class names to the (lazily imported) modules that define them
+$service_modules
+}
+__all__ = ['$client_name', *_SERVICE_MODULES.keys()]
+
+def __getattr__(name: str) -> Any:
+    # service classes are only imported when first used, which keeps importing the client fast
+    module = _SERVICE_MODULES.get(name)
+    if module is None:
+        raise AttributeError(f'module \'{__name__}\' has no attribute \'{name}\'')
+    return getattr(_importlib.import_module(f'.{module}', __name__), name)
+def __dir__() -> List[str]:
+    return sorted([*globals().keys(), *_SERVICE_MODULES.keys()])
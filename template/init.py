@@ -2,16 +2,28 @@
 $description
 '''
 
-from .editor import * # we import editor into global scope
-from . import dev     # users can access dev explicitly if they want
-from . import graphical
-from . import concurrency
-from . import snap
-from . import rooms
-from . import sound
+import importlib as _importlib
+
+from . import editor as _editor
+from .editor import Client # other editor contents (like service classes) are available in global scope, but loaded on demand
 
 from .common import get_location, get_error, nothrow, Namespace
 
+_LAZY_SUBMODULES = { 'dev', 'graphical', 'concurrency', 'snap', 'rooms', 'sound' } # users can access dev explicitly if they want
+
+# `from netsblox import *` still gets everything (resolved by __getattr__), even though it isn't loaded up front
+__all__ = [*_editor.__all__, *sorted(_LAZY_SUBMODULES), 'get_location', 'get_error', 'nothrow', 'Namespace']
+
+def __getattr__(name: str):
+    # submodules and service classes are only imported when first used, which keeps `import netsblox` fast
+    if name in _LAZY_SUBMODULES:
+        return _importlib.import_module(f'.{name}', __name__)
+    if not name.startswith('_'):
+        editor = _importlib.import_module('.editor', __name__)
+        if hasattr(editor, name):
+            return getattr(editor, name)
+    raise AttributeError(f'module \'{__name__}\' has no attribute \'{name}\'')
+
 __version__ = '$version'
 __author__ = '$author'
 __credits__ = '$credits'
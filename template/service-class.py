@@ -1,3 +1,11 @@
+from deprecation import deprecated
+
+from PIL import Image
+
+from typing import Optional, Any, List
+
+import netsblox.common as _common
+
 class $service_name:
 $service_desc
     def __init__(self, client):
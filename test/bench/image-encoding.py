@@ -0,0 +1,32 @@
+#!/usr/bin/env python
+
+# times png encoding of a project's worth of costumes at different compression levels, and again once the encodings are cached
+
+import netsblox.common as common
+from PIL import Image, ImageDraw
+import random
+import time
+
+COSTUMES = 40
+
+def make_costume(seed: int) -> Image.Image:
+    rng = random.Random(seed)
+    img = Image.new('RGBA', (480, 360), (0, 0, 0, 0))
+    draw = ImageDraw.Draw(img)
+    for _ in range(60):
+        x, y = rng.randrange(480), rng.randrange(360)
+        draw.ellipse((x, y, x + rng.randrange(10, 120), y + rng.randrange(10, 120)), fill = tuple(rng.randrange(256) for _ in range(4)))
+    return img
+
+costumes = [make_costume(i) for i in range(COSTUMES)]
+
+def measure(level: int):
+    start = time.time()
+    total = sum(len(common.encode_image(img, compress_level = level, cache = True)) for img in costumes)
+    return time.time() - start, total
+
+for level in [6, 1, 0]:
+    common._encoded_images.clear()
+    first, size = measure(level)
+    again, _ = measure(level)
+    print(f'level {level}: {first * 1000:7.1f}ms first, {again * 1000:6.1f}ms cached, {size / 2 ** 20:5.1f}MiB base64')
@@ -0,0 +1,61 @@
+#!/usr/bin/env python
+
+# measures sending camera-sized images between two pyblox clients (raw attachments) vs the snap-compatible costume format
+
+from netsblox.server import LocalServer
+from PIL import Image
+import numpy as np
+import netsblox.common as common
+import netsblox
+import threading
+import time
+
+N = 200
+SIZE = (320, 240)
+
+rng = np.random.default_rng(0)
+y, x = np.mgrid[0:SIZE[1], 0:SIZE[0]]
+gradient = np.stack([x * 255 // SIZE[0], y * 255 // SIZE[1], (x + y) % 256], axis = -1)
+# photo-like, with some noise - every frame is different (like a camera feed), so nothing can reuse a previous encoding
+frames = [Image.fromarray((gradient + rng.integers(0, 16, (SIZE[1], SIZE[0], 3))).astype(np.uint8), 'RGB') for _ in range(N)]
+
+# encoding cost alone (sending through the local server is dominated by websocket and json overhead for large frames)
+for images in ['raw', 'costume']:
+    start = time.time()
+    packets = [common.small_json({ 'img': frame }, images = images) for frame in frames[:N // 4]]
+    encode_t = (time.time() - start) / (N // 4)
+    start = time.time()
+    for packet in packets:
+        content = common.parse_json(packet)
+        img = common.decode_attachments(content)['img'] if images == 'raw' else common.decode_image(content['img'].split('base64,')[1].split('"')[0]).load()
+    decode_t = (time.time() - start) / (N // 4)
+    print(f'{images}: {len(packets[0])} bytes, encode {encode_t * 1000:.2f}ms, decode {decode_t * 1000:.2f}ms')
+
+with LocalServer() as server:
+    sender = netsblox.Client(base_url = server.base_url)
+    receiver = netsblox.Client(base_url = server.base_url)
+    time.sleep(0.5) # let the websockets connect
+    receiver.send_message('hello', sender.public_id) # any message between them lets the sender learn that the receiver takes raw images
+    time.sleep(0.5)
+
+    done = threading.Event()
+    received = [0, None]
+    @receiver.on_message('frame')
+    def on_frame(img):
+        received[0] += 1
+        received[1] = img
+        if received[0] == N: done.set()
+
+    # the local server ignores the app suffix of addresses, so '#snap' reaches the same client but looks like a non-pyblox receiver
+    for name, target in [('pyblox (raw)', receiver.public_id), ('snap (costume)', receiver.public_id.replace('#py', '#snap'))]:
+        received[0] = 0
+        done.clear()
+        start = time.time()
+        for frame in frames:
+            sender.send_message('frame', target, img = frame)
+        done.wait(120)
+        t = time.time() - start
+        print(f'{name}: {received[0]}/{N} frames in {t:.3f}s ({received[0] / t:.1f} frames/s), received as {type(received[1]).__name__}')
+
+    sender.disconnect()
+    receiver.disconnect()
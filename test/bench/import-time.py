@@ -0,0 +1,24 @@
+#!/usr/bin/env python
+
+# measures the time to import netsblox (and common parts of it) in a fresh interpreter, as happens when running a project
+
+import subprocess
+import statistics
+import sys
+
+REPS = 7
+
+def import_time(code: str) -> float:
+    times = []
+    for _ in range(REPS):
+        src = f'import time\nstart = time.perf_counter()\n{code}\nprint(time.perf_counter() - start)'
+        times.append(float(subprocess.check_output([sys.executable, '-c', src]).decode().strip().splitlines()[-1]))
+    return statistics.median(times) * 1000
+
+for code in [
+    'import netsblox',
+    'import netsblox\nnetsblox.Client',
+    'import netsblox.editor\n[getattr(netsblox.editor, x) for x in dir(netsblox.editor)]',
+    'import netsblox\nfrom netsblox.graphical import *',
+]:
+    print(f'{import_time(code):8.1f}ms    {code.replace(chr(10), "; ")}')
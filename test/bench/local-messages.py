@@ -0,0 +1,39 @@
+#!/usr/bin/env python
+
+# measures the cost of send_message() for large payloads sent to local recipients, a remote client, or both (no internet access needed)
+
+from netsblox.server import LocalServer
+import numpy as np
+import netsblox
+import time
+
+REPS = 10
+
+payloads = {
+    'numpy image': { 'frame': np.random.randint(0, 256, (480, 640, 3), dtype = np.uint8) },
+    'numpy matrix': { 'mat': np.random.rand(500, 500) },
+    'list readings': { 'readings': [[i, i * 0.5, 'sensor'] for i in range(50000)] },
+}
+
+with LocalServer() as server:
+    sender = netsblox.Client(base_url = server.base_url)
+    receiver = netsblox.Client(base_url = server.base_url)
+    time.sleep(0.5) # let the websockets connect
+
+    targets = {
+        'local x1': 'local',
+        'local x3': ['local'] * 3,
+        'remote': receiver.public_id,
+        'local + remote': ['local', receiver.public_id],
+    }
+    for name, values in payloads.items():
+        for target_name, target in targets.items():
+            start = time.time()
+            for _ in range(REPS):
+                sender.send_message('payload', target, **values)
+            t = (time.time() - start) / REPS
+            sender.flush()
+            print(f'{name:>14} to {target_name:<14}: {t * 1000:8.2f}ms per send_message()')
+
+    sender.disconnect()
+    receiver.disconnect()
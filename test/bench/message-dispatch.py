@@ -0,0 +1,39 @@
+#!/usr/bin/env python
+
+# measures message handler dispatch throughput using local (self-addressed) messages, which never touch the network
+
+from netsblox.server import LocalServer
+import netsblox
+import threading
+import time
+
+N = 100000
+
+server = LocalServer().start()
+nb = netsblox.Client(base_url = server.base_url)
+
+counts = { 'all': 0, 'some': 0, 'kwargs': 0 }
+done = { k: threading.Event() for k in counts } # each handler has its own thread, so they finish at different times
+def received(handler):
+    counts[handler] += 1
+    if counts[handler] == N: done[handler].set()
+
+@nb.on_message('reading')
+def on_all(sensor, value, time):
+    received('all')
+@nb.on_message('reading')
+def on_some(value):
+    received('some')
+@nb.on_message('reading')
+def on_kwargs(**kwargs):
+    received('kwargs')
+
+start = time.time()
+for i in range(N):
+    nb.send_message('reading', sensor = 'temp', value = i, time = i / 10)
+for e in done.values(): e.wait()
+t = time.time() - start
+
+print(f'{N} messages x 3 handlers in {t:.3f}s ({N / t:.0f} msg/s) -- {counts}')
+nb.disconnect()
+server.stop()
@@ -0,0 +1,44 @@
+#!/usr/bin/env python
+
+# measures messaging and RPC throughput between two clients through a local server (no internet access needed)
+
+from netsblox.server import LocalServer
+import netsblox
+import threading
+import time
+
+N = 20000
+RPC_N = 500
+
+with LocalServer() as server:
+    server.add_service('Echo', { 'echo': lambda value: value })
+
+    sender = netsblox.Client(base_url = server.base_url)
+    receiver = netsblox.Client(base_url = server.base_url)
+    time.sleep(0.5) # let the websockets connect
+
+    done = threading.Event()
+    received = [0]
+    @receiver.on_message('reading')
+    def on_reading(value):
+        received[0] += 1
+        if received[0] == N: done.set()
+
+    start = time.time()
+    for i in range(N):
+        sender.send_message('reading', receiver.public_id, value = i)
+    sent_t = time.time() - start
+    done.wait(60)
+    t = time.time() - start
+    print(f'messages: {received[0]}/{N} received in {t:.3f}s ({received[0] / t:.0f} msg/s, send_message returned after {sent_t:.3f}s)')
+    print(f'  sender stats: {sender.send_stats}')
+    print(f'  server stats: {server.stats}')
+
+    start = time.time()
+    for i in range(RPC_N):
+        assert sender.call('Echo', 'echo', value = i) == i
+    t = time.time() - start
+    print(f'rpcs: {RPC_N} calls in {t:.3f}s ({RPC_N / t:.0f} calls/s)')
+
+    sender.disconnect()
+    receiver.disconnect()
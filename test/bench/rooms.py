@@ -0,0 +1,83 @@
+#!/usr/bin/env python
+
+# measures room join, role lookup, and leave latency for many simulated clients in one process (no internet access needed)
+
+from netsblox.server import LocalServer
+import netsblox.rooms as rooms
+import netsblox
+import threading
+import time
+
+N = 40 # simulated clients, all joining at once
+ROLES = 4
+LOOKUPS = 100000
+LATENCY = 0.01 # simulated round trip time (seconds) of each storage request, roughly that of cloud variables
+
+class SlowStorage(rooms.LocalRoomStorage):
+    def lock(self, *args):
+        time.sleep(LATENCY)
+        super().lock(*args)
+    def unlock(self, *args):
+        time.sleep(LATENCY)
+        super().unlock(*args)
+    def get(self, *args):
+        time.sleep(LATENCY)
+        return super().get(*args)
+    def set(self, *args):
+        time.sleep(LATENCY)
+        super().set(*args)
+    def delete(self, *args):
+        time.sleep(LATENCY)
+        super().delete(*args)
+
+def stats(times):
+    times = sorted(times)
+    return f'mean {sum(times) / len(times) * 1000:.1f}ms, p50 {times[len(times) // 2] * 1000:.1f}ms, max {times[-1] * 1000:.1f}ms'
+
+with LocalServer() as server:
+    storage = SlowStorage()
+    editor = rooms.EditorRoomManager(get_client = lambda: netsblox.Client(base_url = server.base_url), storage = storage)
+    editor.create_room()
+
+    clients = [netsblox.Client(base_url = server.base_url) for _ in range(N)]
+    time.sleep(1) # let the websockets connect
+
+    managers = [None] * N
+    join_times = [0.0] * N
+    def join(i):
+        start = time.time()
+        managers[i] = rooms.RuntimeRoomManager(client = clients[i], role = f'role{i % ROLES}', room_id = editor.room_id, storage = storage)
+        join_times[i] = time.time() - start
+    start = time.time()
+    threads = [threading.Thread(target = join, args = (i,)) for i in range(N)]
+    for t in threads: t.start()
+    for t in threads: t.join()
+    print(f'joins: {N} concurrent in {time.time() - start:.3f}s ({stats(join_times)})')
+
+    time.sleep(1) # let the membership messages arrive
+    consistent = sum(sum(len(x) for x in m.get_roles().values()) == N for m in managers)
+    print(f'  {consistent}/{N} clients see every room member')
+
+    start = time.time()
+    for i in range(LOOKUPS):
+        managers[i % N].get_roles().get(f'role{i % ROLES}')
+    t = time.time() - start
+    print(f'role lookups: {LOOKUPS} in {t:.3f}s ({t / LOOKUPS * 1e6:.2f}us each)')
+
+    requests = sum(m.metrics['requests'] for m in managers)
+    lock_wait = sum(m.metrics['lock_wait_time'] for m in managers)
+    print(f'  storage requests: {requests} ({lock_wait:.3f}s total waiting for the room lock)')
+
+    leave_times = [0.0] * N
+    def leave(i):
+        start = time.time()
+        managers[i].destroy()
+        leave_times[i] = time.time() - start
+    start = time.time()
+    threads = [threading.Thread(target = leave, args = (i,)) for i in range(N)]
+    for t in threads: t.start()
+    for t in threads: t.join()
+    print(f'leaves: {N} concurrent in {time.time() - start:.3f}s ({stats(leave_times)})')
+
+    editor.destroy()
+    for c in clients: c.disconnect()
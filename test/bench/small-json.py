@@ -0,0 +1,47 @@
+#!/usr/bin/env python
+
+# compares the current message/RPC encoding path to the old recursive one on large sensor-stream-like payloads
+
+import netsblox.common as common
+import numpy as np
+import random
+import json
+import time
+
+def old_small_json(obj):
+    def prep_value(obj):
+        if type(obj) in [list, tuple]:
+            return [prep_value(x) for x in obj]
+        if type(obj) is dict:
+            return { prep_value(k): prep_value(v) for k,v in obj.items() }
+        if type(obj) is np.ndarray:
+            return obj.tolist()
+        return obj
+    return json.dumps(prep_value(obj), separators=(',', ':'))
+def old_prep_send(val):
+    if val is None:
+        return ''
+    if any(isinstance(val, t) for t in [list, tuple, set]):
+        return [old_prep_send(v) for v in val]
+    elif isinstance(val, dict):
+        return [[old_prep_send(k), old_prep_send(v)] for k,v in val.items()]
+    else:
+        return val
+
+def bench(name, f, reps = 10):
+    start = time.perf_counter()
+    for _ in range(reps):
+        f()
+    print(f'{name:<40} {(time.perf_counter() - start) / reps * 1000:8.2f} ms')
+
+readings = [[random.random(), random.random(), random.random(), i] for i in range(100000)]
+matrix = np.random.rand(1000, 300)
+text = common.small_json({ 'readings': readings })
+
+print('orjson:', common._orjson is not None)
+bench('old send (list of readings)', lambda: old_small_json({ k: old_prep_send(v) for k, v in { 'readings': readings }.items() }))
+bench('new send (list of readings)', lambda: common.small_json({ k: common.prep_send(v) for k, v in { 'readings': readings }.items() }))
+bench('old send (numpy matrix)', lambda: old_small_json({ 'matrix': old_prep_send(matrix) }))
+bench('new send (numpy matrix)', lambda: common.small_json({ 'matrix': common.prep_send(matrix) }))
+bench('old receive', lambda: json.loads(text))
+bench('new receive', lambda: common.parse_json(text))
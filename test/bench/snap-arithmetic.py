@@ -0,0 +1,38 @@
+#!/usr/bin/env python
+
+# compares hyperized snap.List arithmetic with and without the numpy fast path on large numeric lists and matrices
+
+import netsblox.snap as snap
+import random
+import math
+import time
+
+vec = snap.wrap([random.uniform(-100, 100) for _ in range(100000)])
+mat = snap.wrap([[random.uniform(-100, 100) for _ in range(300)] for _ in range(300)])
+
+cases = [
+    ('vec + vec', lambda: vec + vec),
+    ('vec * 3', lambda: vec * 3),
+    ('vec / vec', lambda: vec / vec),
+    ('vec ** 2', lambda: vec ** 2),
+    ('vec > 0', lambda: vec > 0),
+    ('sqrt(abs(vec))', lambda: snap.sqrt(abs(vec))),
+    ('sin(vec)', lambda: snap.sin(vec)),
+    ('round(vec)', lambda: round(vec)),
+    ('mat + mat', lambda: mat + mat),
+    ('mat * row', lambda: mat * mat[0]),
+]
+
+def measure(f, n = 3):
+    start = time.time()
+    for _ in range(n): f()
+    return (time.time() - start) / n
+
+for name, f in cases:
+    fast = measure(f)
+    size, snap._NUMPY_MIN_SIZE = snap._NUMPY_MIN_SIZE, math.inf
+    try:
+        slow = measure(f, 1)
+    finally:
+        snap._NUMPY_MIN_SIZE = size
+    print(f'{name:>16}: {slow * 1000:8.1f}ms element-wise, {fast * 1000:7.1f}ms numpy ({slow / fast:.1f}x)')
@@ -0,0 +1,49 @@
+#!/usr/bin/env python
+
+# compares time and peak memory of loading a large csv/json file with split_csv/split_json (on the file content) and read_csv/read_json
+
+import netsblox.snap as snap
+import tracemalloc
+import tempfile
+import random
+import json
+import time
+import csv
+import os
+
+ROWS = 200000
+
+def measure(f):
+    start = time.time()
+    f()
+    t = time.time() - start
+
+    tracemalloc.start() # tracing slows down allocations, so it gets a separate run
+    f()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return t, peak
+
+with tempfile.TemporaryDirectory() as d:
+    csv_path, json_path = os.path.join(d, 'data.csv'), os.path.join(d, 'data.json')
+    with open(csv_path, 'w', newline = '') as f:
+        writer = csv.writer(f)
+        writer.writerow(['id', 'x', 'y', 'label'])
+        for i in range(ROWS):
+            writer.writerow([i, random.uniform(-1, 1), random.uniform(-1, 1), random.choice(['a', 'b', 'c'])])
+    with open(json_path, 'w') as f:
+        json.dump({ 'samples': [[random.uniform(-1, 1) for _ in range(100)] for _ in range(ROWS // 20)] }, f)
+
+    def read(path):
+        with open(path) as f: return f.read()
+
+    cases = [
+        ('split_csv', lambda: snap.split_csv(read(csv_path))),
+        ('read_csv', lambda: snap.read_csv(csv_path)),
+        ('read_csv numbers', lambda: snap.read_csv(csv_path, numbers = True)),
+        ('split_json', lambda: snap.split_json(read(json_path))),
+        ('read_json', lambda: snap.read_json(json_path)),
+    ]
+    for name, f in cases:
+        t, peak = measure(f)
+        print(f'{name:>16}: {t * 1000:7.1f}ms, {peak / 2 ** 20:6.1f}MiB peak')
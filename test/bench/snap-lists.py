@@ -0,0 +1,34 @@
+#!/usr/bin/env python
+
+# compares compact (float64 array) and boxed (one Float per item) storage for large numeric snap.Lists
+
+import netsblox.snap as snap
+import tracemalloc
+import random
+import time
+
+N = 1000000
+values = [random.uniform(-100, 100) for _ in range(N)]
+
+def build(compact: bool):
+    tracemalloc.start()
+    start = time.time()
+    res = snap.wrap(values) if compact else snap.List(map(snap.Float, values))
+    t = time.time() - start
+    mem = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return res, t, mem
+
+def measure(f, n = 3):
+    start = time.time()
+    for _ in range(n): f()
+    return (time.time() - start) / n
+
+def iterate(v):
+    for x in v: pass
+def index(v):
+    for i in range(0, len(v), 10): v[i]
+
+for compact in [False, True]:
+    v, t, mem = build(compact)
+    print(f'{"compact" if compact else "boxed":>8}: build {t * 1000:7.1f}ms, {mem / 2 ** 20:6.1f}MiB, iterate {measure(lambda: iterate(v)) * 1000:7.1f}ms, index {measure(lambda: index(v)) * 1000:6.1f}ms, v + v {measure(lambda: v + v) * 1000:6.1f}ms')
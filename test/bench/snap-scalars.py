@@ -0,0 +1,46 @@
+#!/usr/bin/env python
+
+# times tight loops of snap.Float arithmetic and comparisons with and without the scalar fast path (plain python floats for reference)
+
+import netsblox.snap as snap
+import time
+
+N = 200000
+
+def arith(x, y):
+    acc = x
+    for _ in range(N):
+        acc = (acc + y) * 0.5 - 1 / y
+    return acc
+def compare(x, y):
+    hits = 0
+    for _ in range(N):
+        if x < y and y >= 3 and not x > 10: hits += 1
+    return hits
+def count(start, step):
+    i = start
+    while i < N:
+        i += step
+    return i
+
+cases = [
+    ('arithmetic', arith, (1.5, 4.0)),
+    ('comparisons', compare, (1.5, 4.0)),
+    ('counting loop', count, (0, 1)),
+]
+
+def measure(f, args, n = 3):
+    start = time.time()
+    for _ in range(n): f(*args)
+    return (time.time() - start) / n
+
+for name, f, args in cases:
+    wrapped = [snap.wrap(x) for x in args]
+    plain = measure(f, args)
+    fast = measure(f, wrapped)
+    types, snap._FAST_TYPES = snap._FAST_TYPES, set() # every operand then takes the general path (wrap, _scalar_op, _list_binary_op)
+    try:
+        general = measure(f, wrapped, 1)
+    finally:
+        snap._FAST_TYPES = types
+    print(f'{name:>14}: {general * 1000:7.1f}ms general, {fast * 1000:7.1f}ms fast path ({general / fast:.1f}x), {plain * 1000:6.1f}ms python')
@@ -0,0 +1,26 @@
+#!/usr/bin/env python
+
+import netsblox
+import threading
+import time
+
+editor = netsblox.Client()
+
+got = []
+
+@editor.on_message('tick')
+def foo(i):
+    got.append(i)
+
+editor.set_message_queue_limit('tick', 1, 'block')
+
+def send():
+    for i in range(20):
+        editor.send_message('tick', ['local', 'local'], i = i)
+sender = threading.Thread(target = send, daemon = True)
+sender.start()
+sender.join(10)
+assert not sender.is_alive(), 'sending to a repeated local target with a full blocking queue deadlocked'
+
+time.sleep(1)
+assert sorted(got) == sorted([*range(20)] * 2), f'got {got}'